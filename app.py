@@ -1,14 +1,24 @@
-import pickle
 import streamlit as st
-import requests
 import os
 import gdown
 import pandas as pd
 from src.model_training import ModelTraining
+from src.similarity_index import build_similarity_index
+from src.neighbour_table import NeighbourTable
+from src.als import ALSModel
+from src.artifact_store import ArtifactStore
+from src.catalogue import ServingCatalogue
+from src.poster_resolver import PosterResolver
+from src.recommendation_cache import RecommendationCache, most_rated_movies, DEFAULT_CACHE_PATH as RECOMMENDATION_CACHE_PATH
+from src.instrumentation import RunReport
 
 @st.cache_resource(ttl=86400) # Cache for 1 day
 def download_artifacts():
-    """Download model artifacts from Google Drive if not exist"""
+    """Download model artifacts from Google Drive and convert them into the artifact store if not exist"""
+    
+    store = ArtifactStore()
+    if store.current_version() is not None:
+        return
     
     files = {
         'artifacts/movies_processed.pkl': '1CW_jp-3g1QB7m4_eJKv_a4ju_8vRZ9yH',
@@ -23,70 +33,110 @@ def download_artifacts():
         if not os.path.exists(filepath):
             url = f'https://drive.google.com/uc?id={file_id}'
             gdown.download(url, filepath, quiet=False)
+    
+    # One-off conversion, later starts memory-map the store instead of unpickling
+    store.convert_pickles('artifacts')
 
 download_artifacts()
 
-@st.cache_data
-def fetch_poster(movie_id):
-    """Fetches the movie poster URL from TMDB API."""
-    if pd.isna(movie_id):
-        return "https://placehold.co/500x750/333/FFFFFF?text=No+Poster"
-    
-    url = f"https://api.themoviedb.org/3/movie/{int(movie_id)}?api_key=8265bd1679663a7ea12ac168da84d2e8&language=en-US"
-    try:
-        data = requests.get(url, timeout=5)
-        data.raise_for_status()
-        data = data.json()
-        poster_path = data.get('poster_path')
-        if poster_path:
-            return f"https://image.tmdb.org/t/p/w500{poster_path}"
-    except:
-        pass
-    return "https://placehold.co/500x750/333/FFFFFF?text=No+Poster"
+@st.cache_resource
+def load_run_report():
+    """Stage timings of the loaders and of the latest recommendation requests of this process."""
+    return RunReport('serving', max_records=500)
+
+
+@st.cache_resource
+def load_poster_resolver():
+    """Concurrent TMDB poster resolver over a pooled session and the on-disk poster cache."""
+    return PosterResolver()
 
 
 @st.cache_resource
-def recommend(movie_title, metric, algorithm):
+def load_artifacts():
+    """Memory-maps the current artifact store version once per process."""
+    with load_run_report().stage('load artifacts') as record:
+        artifacts = ArtifactStore().load(mmap_mode='r')
+        record.update(version=artifacts.version, nnz=int(artifacts.X.nnz))
+    return artifacts
+
+
+@st.cache_resource
+def load_catalogue():
+    """Builds the title/movieId lookup indexes over the movies frame once per process."""
+    movies = load_artifacts().movies
+    with load_run_report().stage('load catalogue', rows=len(movies)):
+        return ServingCatalogue(movies)
+
+
+@st.cache_resource
+def load_index(metric, algorithm, k=13):
+    """Loads the precomputed neighbour table or ALS factors, or fits the item similarity index once per (metric, algorithm)."""
+    with load_run_report().stage(f'load index [{metric}/{algorithm}]'):
+        if algorithm == 'als':
+            model = ALSModel.from_arrays(load_artifacts().arrays, X)
+            if model is not None:
+                return model
+        table = NeighbourTable.from_arrays(load_artifacts().arrays, metric)
+        if table is not None and table.n_neighbors >= k + 1 and algorithm not in ('ann', 'als'):
+            return table
+        return build_similarity_index(X, metric=metric, algorithm=algorithm)
+
+
+@st.cache_resource
+def load_model(metric, algorithm, k=13):
+    """ModelTraining bound to the cached index, answering batch neighbour queries."""
+    return ModelTraining(
+        movie_id=None,
+        X=X,
+        movie_mapper=movie_mapper,
+        movie_inv_mapper=movie_inv_mapper,
+        k=k,
+        metric=metric,
+        algorithm=algorithm,
+        index=load_index(metric, algorithm, k)
+    )
+
+
+@st.cache_resource
+def load_recommendation_cache(n_prewarm=500, k=13):
+    """Neighbour cache shared by the workers, pre-warmed for the most-rated movies of the default style."""
+    cache = RecommendationCache(disk_path=RECOMMENDATION_CACHE_PATH, namespace=load_artifacts().version)
+    top_movies = most_rated_movies(X, movie_inv_mapper, n_prewarm)
+    model = load_model('cosine', 'brute', k)
+    with load_run_report().stage('prewarm cache', movies=len(top_movies)):
+        cache.prewarm(top_movies, 'cosine', 'brute', k, model.find_similar_movies_batch)
+    return cache
+
+
+def recommend(movie_title, metric, algorithm, k=13):
     """Recommends similar movies using k-NN collaborative filtering."""
+    report = load_run_report()
     try:
-        # Find movie in dataset
-        movie_data = movies[movies['title'] == movie_title]
-        if movie_data.empty:
-            st.error("Movie not found.")
-            return [], [], [], []
-        
-        movie_id = movie_data.iloc[0]['movieId']
-        
-        # Use k-NN to find similar movies
-        model = ModelTraining(
-            movie_id=movie_id,
-            X=X,
-            movie_mapper=movie_mapper,
-            movie_inv_mapper=movie_inv_mapper,
-            k=13,
-            metric=metric,
-            algorithm=algorithm
-        )
-        
-        similar_movie_ids = model.find_similar_movies()
-        
-        # Collect recommendations
-        recommended_movie_names = []
-        recommended_movie_posters = []
-        recommended_movie_years = []
-        recommended_movie_ratings = []
-        
-        for rec_movie_id in similar_movie_ids:
-            movie_info = movies[movies['movieId'] == rec_movie_id]
-            if not movie_info.empty:
-                row = movie_info.iloc[0]
-                
-                recommended_movie_names.append(row['title'])
-                recommended_movie_posters.append(fetch_poster(row.get('movie_id')))
-                recommended_movie_years.append(row.get('year', 'N/A'))
-                recommended_movie_ratings.append(row.get('avg_rating', 0))
-        
-        return recommended_movie_names, recommended_movie_posters, recommended_movie_years, recommended_movie_ratings
+        with report.stage('recommend', metric=metric, algorithm=algorithm, k=k):
+            # Find movie in dataset
+            movie_id = catalogue.movie_id(movie_title)
+            if movie_id is None:
+                st.error("Movie not found.")
+                return [], [], [], []
+            
+            # Use k-NN to find similar movies (served from the recommendation cache when possible)
+            model = load_model(metric, algorithm, k)
+            cache = load_recommendation_cache()
+            with report.stage('neighbours'):
+                [(similar_movie_ids, _)] = cache.get_or_compute(
+                    [movie_id], metric, algorithm, k, model.find_similar_movies_batch
+                )
+            
+            # Collect recommendations with one vectorized lookup into the catalogue
+            with report.stage('hydrate', rows=len(similar_movie_ids)):
+                recommended = catalogue.hydrate(similar_movie_ids)
+            with report.stage('posters', rows=len(similar_movie_ids)):
+                recommended_movie_posters = load_poster_resolver().resolve(recommended['movie_id'])
+            recommended_movie_names = recommended['title'].tolist()
+            recommended_movie_years = recommended['year'].tolist()
+            recommended_movie_ratings = recommended['avg_rating'].tolist()
+            
+            return recommended_movie_names, recommended_movie_posters, recommended_movie_years, recommended_movie_ratings
         
     except Exception as e:
         st.error(f"Error: {str(e)}")
@@ -99,10 +149,12 @@ st.header("🎬 Movie Recommender System")
 
 # Load the data files
 try:
-    movies = pd.read_pickle('artifacts/movies_processed.pkl')
-    X = pickle.load(open('artifacts/X_matrix.pkl', 'rb'))
-    movie_mapper = pickle.load(open('artifacts/movie_mapper.pkl', 'rb'))
-    movie_inv_mapper = pickle.load(open('artifacts/movie_inv_mapper.pkl', 'rb'))
+    artifacts = load_artifacts()
+    movies = artifacts.movies
+    X = artifacts.X
+    movie_mapper = artifacts.movie_mapper
+    movie_inv_mapper = artifacts.movie_inv_mapper
+    catalogue = load_catalogue()
     
     st.success(f"Loaded {movies['title'].nunique():,} movies with {X.nnz:,} ratings for {X.shape[0]:,} users.")
     
@@ -119,17 +171,26 @@ except FileNotFoundError:
 # Choose the recommendation style
 metric = st.selectbox(
     "Select Recommendation Style",
-    ('Netflix', 'TMDB|IMDb')
+    ('Netflix', 'TMDB|IMDb', 'Fast (ANN)', 'Latent factors (ALS)')
 ) 
 if metric == 'Netflix':
     metric_value = 'cosine' # Netflix-style recommendations (It has diversity than any other metric)
     algorithm_value = 'brute'
+elif metric == 'Fast (ANN)':
+    metric_value = 'cosine' # Approximate Netflix-style recommendations from low-rank item embeddings
+    algorithm_value = 'ann'
+elif metric == 'Latent factors (ALS)':
+    metric_value = 'cosine' # Cosine similarity of the item factors of the matrix-factorization model
+    algorithm_value = 'als'
 else:
     metric_value = 'manhattan' # TMDB/IMDb-style recommendations 
     algorithm_value = 'auto'
 
 # Sidebar
 with st.sidebar:
+    cache_stats = load_recommendation_cache().stats()
+    st.caption(f"Recommendation cache: {cache_stats['hits'] + cache_stats['disk_hits']:,} hits, "
+               f"{cache_stats['misses']:,} misses ({cache_stats['entries']:,} entries)")
     st.markdown("### Connect with me")
     st.markdown("""
         <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css">
@@ -142,7 +203,7 @@ with st.sidebar:
     """, unsafe_allow_html=True)
 
 # Movie selection
-movie_list = movies['title'].values
+movie_list = catalogue.titles
 selected_movie = st.selectbox(
     "select a movie from the dropdown",
     movie_list
@@ -150,7 +211,7 @@ selected_movie = st.selectbox(
 
 # Show selected movie info
 if selected_movie:
-    selected_info = movies[movies['title'] == selected_movie].iloc[0]
+    selected_info = catalogue.info(selected_movie)
     
     col1, col2 = st.columns(2)
     with col1:
@@ -214,3 +275,12 @@ if st.button('Show Recommendation'):
                     st.caption(f"Rating: {rating:.1f}")
                 else:
                     st.caption("Rating: N/A")
+
+# Stage timings of this process (loaders and the latest requests)
+with st.sidebar:
+    with st.expander("Timings"):
+        timings = pd.DataFrame(list(load_run_report().records)[-20:])
+        if not timings.empty:
+            timings['wall_ms'] = timings['wall_s'] * 1000
+            timings['cpu_ms'] = timings['cpu_s'] * 1000
+            st.dataframe(timings[['name', 'parent', 'wall_ms', 'cpu_ms', 'peak_rss_mb']], hide_index=True)
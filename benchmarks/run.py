@@ -0,0 +1,196 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+import numpy as np
+import pandas as pd
+import scipy
+import sklearn
+from benchmarks.synthetic import write_movielens_zip
+from src.artifact_store import ArtifactStore
+from src.data_ingestion import ZipDataIngestor
+from src.data_preprocessing import DataPreprocessing
+from src.instrumentation import RunReport
+from src.model_training import ModelTraining
+from src.neighbour_table import NeighbourTableBuilder, SUPPORTED_METRICS
+from src.sharded_index import resolve_workers
+from src.similarity_index import build_similarity_index
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+SCALES = {'1M': 1_000_000, '5M': 5_000_000, '10M': 10_000_000, '25M': 25_000_000, '50M': 50_000_000}
+DEFAULT_RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+
+def latency_summary(latencies):
+    """Percentiles of per-query latencies (seconds) in milliseconds."""
+    latencies = np.asarray(latencies) * 1000
+    return {f'p{q}_ms': float(np.percentile(latencies, q)) for q in (50, 90, 99)} | {'mean_ms': float(latencies.mean())}
+
+
+def run_scale(n_ratings, workdir, metrics=None, k=13, n_queries=200, batch_size=256, seed=0, n_workers=()):
+    """
+    Benchmarks every pipeline stage and the query paths on one synthetic dataset.
+
+    Args:
+        n_ratings: number of synthetic ratings
+        workdir: directory for the zip and the artifact store
+        metrics: dict mapping metric to kNN algorithm (defaults to SUPPORTED_METRICS)
+        k: k of the ModelTraining queries (the app uses 13)
+        n_queries: number of single find_similar_movies queries
+        batch_size: movies per find_similar_movies_batch call
+        seed: random seed of the data and of the query sample
+        n_workers: worker counts of the sharded neighbour-table build to measure (e.g. 1 2 4 8 for scaling)
+
+    Returns:
+        dict with the stage measurements and the query latencies / throughput per metric
+    """
+    metrics = SUPPORTED_METRICS if metrics is None else metrics
+    # the report is active, so the steps of DataPreprocessing.clean are recorded as well
+    report = RunReport('benchmark').activate()
+    zip_path = os.path.join(workdir, 'ml-latest.zip')
+    with report.stage('generate') as record:
+        write_movielens_zip(zip_path, n_ratings, seed=seed)
+        record['zip_mb'] = os.path.getsize(zip_path) / 1024**2
+
+    with report.stage('ingest') as record:
+        links, movies, ratings = ZipDataIngestor(stream=True).ingest(zip_path)
+        record['rows'] = len(ratings)
+
+    with report.stage('clean') as record:
+        store = ArtifactStore(os.path.join(workdir, 'store'))
+        final_ratings, X, movie_mapper, movie_inv_mapper = DataPreprocessing().clean(movies, ratings, links, store=store)
+        record.update({'rows': len(final_ratings), 'nnz': int(X.nnz), 'users': X.shape[0], 'items': X.shape[1]})
+    del links, movies, ratings
+
+    with report.stage('create_X') as record:
+        X_again, _, _ = DataPreprocessing.create_X(final_ratings)
+        record['nnz'] = int(X_again.nnz)
+    del X_again, final_ratings
+
+    rng = np.random.default_rng(seed)
+    query_ids = movie_inv_mapper.to_ids(rng.choice(X.shape[1], min(n_queries, X.shape[1]), replace=False))
+    queries = {}
+    for metric, algorithm in metrics.items():
+        name = f'{metric}/{algorithm}'
+        with report.stage(f'index[{name}]'):
+            index = build_similarity_index(X, metric=metric, algorithm=algorithm)
+
+        model = ModelTraining(None, X, movie_mapper, movie_inv_mapper, k, metric, algorithm, index=index)
+        latencies = []
+        for movie_id in query_ids:
+            model.movie_id = movie_id
+            start = time.perf_counter()
+            model.find_similar_movies()
+            latencies.append(time.perf_counter() - start)
+
+        with report.stage(f'batch[{name}]'):
+            start = time.perf_counter()
+            for offset in range(0, len(query_ids), batch_size):
+                model.find_similar_movies_batch(query_ids[offset:offset + batch_size])
+            batch_time = time.perf_counter() - start
+
+        queries[name] = {
+            'single': latency_summary(latencies) | {'qps': len(latencies) / sum(latencies)},
+            'batch': {'batch_size': batch_size, 'qps': len(query_ids) / batch_time},
+        }
+        del index, model
+
+        for workers in n_workers:
+            # counts above the cores are capped and a single worker runs in process, so the count used is recorded
+            with report.stage(f'table[{name} x{workers}]', workers=workers, workers_used=resolve_workers(workers)) as record:
+                NeighbourTableBuilder(k=k + 1, n_workers=workers).build_table(X, metric=metric, algorithm=algorithm)
+            record['items_per_s'] = X.shape[1] / record['wall_s']
+
+    report.deactivate()
+    stages = {record['name'] if record['parent'] is None else f"{record['parent']}/{record['name']}": record
+              for record in report.records}
+    return {'n_ratings': n_ratings, 'stages': stages, 'queries': queries}
+
+
+def environment():
+    """Commit, library versions and machine facts that make results comparable across runs."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pandas': pd.__version__,
+        'sklearn': sklearn.__version__,
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def run(scales, workdir=None, **kwargs):
+    """Runs every scale in a fresh process, so peak memory and caches do not carry over between scales."""
+    results = {'created': datetime.now(timezone.utc).isoformat(), 'environment': environment(),
+               'config': kwargs, 'scales': {}}
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        for name in scales:
+            scale_dir = os.path.join(tmp, name)
+            os.makedirs(scale_dir)
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+                results['scales'][name] = executor.submit(run_scale, SCALES[name], scale_dir, **kwargs).result()
+    return results
+
+
+def compare(baseline, current):
+    """Prints the current/baseline ratio of every stage time and query metric (below 1 is faster)."""
+    for scale, result in current['scales'].items():
+        base = baseline['scales'].get(scale)
+        if base is None:
+            continue
+        print(f'== {scale} ({baseline["environment"]["commit"]} -> {current["environment"]["commit"]})')
+        for stage, record in result['stages'].items():
+            if stage in base['stages']:
+                print(f'{stage:<28} {base["stages"][stage]["wall_s"]:>10.3f}s {record["wall_s"]:>10.3f}s '
+                      f'{record["wall_s"] / base["stages"][stage]["wall_s"]:>7.2f}x')
+        for name, query in result['queries'].items():
+            if name in base['queries']:
+                for key in ('p50_ms', 'p99_ms', 'qps'):
+                    old, new = base['queries'][name]['single'][key], query['single'][key]
+                    print(f'{name + " single " + key:<28} {old:>11.3f} {new:>11.3f} {new / old:>7.2f}x')
+                old, new = base['queries'][name]['batch']['qps'], query['batch']['qps']
+                print(f'{name + " batch qps":<28} {old:>11.1f} {new:>11.1f} {new / old:>7.2f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline stages and query latency on synthetic MovieLens data")
+    parser.add_argument('--scales', nargs='+', default=['1M'], choices=list(SCALES))
+    parser.add_argument('--n-queries', type=int, default=200, help="single queries per metric")
+    parser.add_argument('--batch-size', type=int, default=256, help="movies per batch query")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--n-workers', type=int, nargs='*', default=[],
+                        help="worker counts of the sharded neighbour-table build (e.g. 1 2 4 8)")
+    parser.add_argument('--workdir', default=None, help="directory for the temporary data (system temp by default)")
+    parser.add_argument('--output', default=None, help="results path (JSON)")
+    parser.add_argument('--compare', default=None, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = run(args.scales, workdir=args.workdir, n_queries=args.n_queries, batch_size=args.batch_size, seed=args.seed,
+                  n_workers=args.n_workers)
+    output = args.output or os.path.join(
+        DEFAULT_RESULTS_DIR, f"{results['environment']['commit'] or 'local'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    logging.info(f'Saved benchmark results: {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
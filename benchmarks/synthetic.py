@@ -0,0 +1,144 @@
+import logging
+import os
+from zipfile import ZipFile, ZIP_DEFLATED
+import numpy as np
+import pandas as pd
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Shape of MovieLens ml-latest (about 33M ratings, 330k users, 86k movies)
+RATINGS_PER_USER = 100
+RATINGS_PER_MOVIE = 380
+
+# Share of each half-star rating (0.5 ... 5.0) in MovieLens
+RATING_VALUES = np.arange(1, 11, dtype=np.float32) / 2
+RATING_SHARES = np.array([1.5, 3.0, 2.0, 7.0, 5.0, 20.0, 12.0, 27.0, 8.0, 14.5])
+RATING_SHARES = RATING_SHARES / RATING_SHARES.sum()
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Fantasy',
+          'Horror', 'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War', 'Western']
+
+
+def default_shape(n_ratings):
+    """Number of users and movies of a MovieLens-shaped dataset with n_ratings ratings."""
+    return max(100, n_ratings // RATINGS_PER_USER), max(200, n_ratings // RATINGS_PER_MOVIE)
+
+
+def power_law(n, alpha, rng):
+    """Sampling probabilities proportional to rank^-alpha, assigned to the n ids in random order."""
+    weights = 1.0 / np.arange(1, n + 1) ** alpha
+    return rng.permutation(weights / weights.sum())
+
+
+def generate_movies(n_movies, seed=0):
+    """
+    Generates the movies and links frames.
+
+    Args:
+        n_movies: number of movies
+        seed: random seed
+
+    Returns:
+        movies: movieId, title (with year), genres
+        links: movieId, imdbId, tmdbId (about 1% of the tmdbIds missing)
+    """
+    rng = np.random.default_rng(seed)
+    # MovieLens movieIds are sparse, not 1..n
+    movie_ids = np.sort(rng.choice(np.arange(1, n_movies * 3 + 1), n_movies, replace=False)).astype(np.int32)
+    years = rng.integers(1920, 2024, n_movies)
+    genre_picks = rng.integers(0, len(GENRES), (n_movies, 3))
+    movies = pd.DataFrame({
+        'movieId': movie_ids,
+        'title': [f'Movie {movie_id} ({year})' for movie_id, year in zip(movie_ids, years)],
+        'genres': ['|'.join(sorted({GENRES[g] for g in picks})) for picks in genre_picks],
+    })
+    tmdb_ids = (movie_ids * 7 + 11).astype(np.float64)
+    tmdb_ids[rng.random(n_movies) < 0.01] = np.nan
+    links = pd.DataFrame({'movieId': movie_ids, 'imdbId': movie_ids + 100_000, 'tmdbId': tmdb_ids})
+    return movies, links
+
+
+def generate_ratings(n_ratings, movie_ids, n_users, movie_alpha=1.0, user_alpha=0.5, chunksize=1_000_000, seed=0):
+    """
+    Yields the ratings frame in chunks.
+
+    Movie popularity and user activity both follow power laws, so a few blockbusters
+    and heavy raters hold most of the ratings, as in MovieLens.
+
+    Args:
+        n_ratings: total number of ratings
+        movie_ids: array of movieIds
+        n_users: number of users (userIds 1..n_users)
+        movie_alpha: exponent of the movie popularity power law
+        user_alpha: exponent of the user activity power law
+        chunksize: rows per yielded frame
+        seed: random seed
+
+    Yields:
+        frames with the columns userId, movieId, rating, timestamp
+    """
+    rng = np.random.default_rng(seed)
+    movie_p = power_law(len(movie_ids), movie_alpha, rng)
+    user_p = power_law(n_users, user_alpha, rng)
+    for start in range(0, n_ratings, chunksize):
+        size = min(chunksize, n_ratings - start)
+        yield pd.DataFrame({
+            'userId': (rng.choice(n_users, size, p=user_p) + 1).astype(np.int32),
+            'movieId': rng.choice(movie_ids, size, p=movie_p),
+            'rating': rng.choice(RATING_VALUES, size, p=RATING_SHARES),
+            'timestamp': rng.integers(828_000_000, 1_690_000_000, size),
+        })
+
+
+def generate_movielens(n_ratings, n_users=None, n_movies=None, seed=0, **kwargs):
+    """
+    Generates MovieLens-shaped links, movies and ratings frames in memory.
+
+    Args:
+        n_ratings: number of ratings
+        n_users: number of users (n_ratings / 100 if None)
+        n_movies: number of movies (n_ratings / 380 if None)
+        seed: random seed
+        kwargs: passed on to generate_ratings
+
+    Returns:
+        links, movies, ratings in the order ZipDataIngestor.ingest returns them
+    """
+    default_users, default_movies = default_shape(n_ratings)
+    movies, links = generate_movies(n_movies or default_movies, seed=seed)
+    ratings = pd.concat(generate_ratings(n_ratings, movies['movieId'].to_numpy(), n_users or default_users,
+                                         seed=seed, **kwargs), ignore_index=True)
+    return links, movies, ratings
+
+
+def write_movielens_zip(path, n_ratings, n_users=None, n_movies=None, seed=0, chunksize=1_000_000, **kwargs):
+    """
+    Writes a synthetic ml-latest.zip (ml-latest/{links,movies,ratings}.csv) without holding all ratings in memory.
+
+    Args:
+        path: zip file to write
+        n_ratings: number of ratings
+        n_users: number of users (n_ratings / 100 if None)
+        n_movies: number of movies (n_ratings / 380 if None)
+        seed: random seed
+        chunksize: ratings generated and written per chunk
+        kwargs: passed on to generate_ratings
+
+    Returns:
+        path
+    """
+    default_users, default_movies = default_shape(n_ratings)
+    movies, links = generate_movies(n_movies or default_movies, seed=seed)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with ZipFile(path, 'w', ZIP_DEFLATED, compresslevel=1) as zip_file:
+        zip_file.writestr('ml-latest/links.csv', links.to_csv(index=False))
+        zip_file.writestr('ml-latest/movies.csv', movies.to_csv(index=False))
+        with zip_file.open('ml-latest/ratings.csv', 'w', force_zip64=True) as f:
+            chunks = generate_ratings(n_ratings, movies['movieId'].to_numpy(), n_users or default_users,
+                                      chunksize=chunksize, seed=seed, **kwargs)
+            for i, chunk in enumerate(chunks):
+                f.write(chunk.to_csv(index=False, header=i == 0).encode())
+    logging.info(f'Wrote synthetic MovieLens zip: {path} ({n_ratings:,} ratings)')
+    return path
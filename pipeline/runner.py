@@ -0,0 +1,386 @@
+import argparse
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+
+from src.data_ingestion import ZipDataIngestor
+from src.data_preprocessing import DataPreprocessing
+from src.artifact_store import ArtifactStore, DEFAULT_STORE_DIR
+from src.neighbour_table import NeighbourTable, NeighbourTableBuilder, SUPPORTED_METRICS
+from src.model_training import ModelTraining
+from src.similarity_index import build_similarity_index
+from src.instrumentation import RunReport
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_CACHE_DIR = os.path.join('artifacts', 'pipeline_cache')
+CSV_FRAMES = {'links': 'links.csv', 'movies': 'movies.csv', 'ratings': 'ratings.csv'}
+
+
+def file_digest(file_path, cache_dir=DEFAULT_CACHE_DIR, block_size=8 * 1024**2):
+    """SHA-256 of a file's content, remembered per (path, size, mtime) so unchanged inputs are hashed once."""
+    stat = os.stat(file_path)
+    memo_path = os.path.join(cache_dir, 'file_digests.json')
+    memo = {}
+    if os.path.exists(memo_path):
+        with open(memo_path) as f:
+            memo = json.load(f)
+    memo_key = f'{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    if memo_key not in memo:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+        memo[memo_key] = digest.hexdigest()
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(memo_path, 'w') as f:
+            json.dump(memo, f)
+    return memo[memo_key]
+
+
+# Create Class for a Pipeline Stage
+class Stage:
+    def __init__(self, name, run, load, deps=(), params=None, files=(), modules=(), parallel=False, valid=None):
+        """
+        One cached step of the pipeline DAG.
+
+        Args:
+            name: unique stage name
+            run: function run(inputs, output_dir, **params) writing the stage output into output_dir;
+                inputs maps every dependency name to its loaded output
+            load: function load(output_dir) returning the output (raises FileNotFoundError if it is gone)
+            deps: names of the stages whose outputs are inputs of this one
+            params: keyword arguments of run, part of the cache key
+            files: input files whose content is part of the cache key
+            modules: module names whose source is part of the cache key (code changes invalidate the cache)
+            parallel: whether the stage may run in a worker process next to other stages
+            valid: function valid(output_dir) telling whether a cached output is still usable
+                (e.g. the store version it points at was not deleted)
+        """
+        self.name = name
+        self.run = run
+        self.load = load
+        self.deps = tuple(deps)
+        self.params = params or {}
+        self.files = tuple(files)
+        self.modules = tuple(modules)
+        self.parallel = parallel
+        self.valid = valid
+
+
+def _execute(stage, dep_outputs, output_dir):
+    """Loads the inputs and runs one stage (in the runner or a worker process), returns its report record."""
+    inputs = {name: load(path) for name, (load, path) in dep_outputs.items()}
+    report = RunReport(stage.name)
+    with report.stage(stage.name, cached=False):
+        stage.run(inputs, output_dir, **stage.params)
+    return report.records[-1]
+
+
+# Create Class for the DAG Runner
+class PipelineRunner:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, n_jobs=-1, force=()):
+        """
+        Runs a DAG of stages, skipping the ones whose inputs, parameters and code did not change.
+
+        Every stage writes into <cache_dir>/<name>-<key>, where key is a hash of its
+        parameters, input file contents, module sources and the keys of its
+        dependencies. The directory only gets its final name once the stage has
+        finished, so an interrupted run resumes at the first unfinished stage.
+        Stages marked parallel whose dependencies are done run side by side in a
+        process pool.
+
+        Args:
+            cache_dir: directory of the stage outputs
+            n_jobs: number of worker processes (-1 uses all cores, 1 runs everything in this process)
+            force: names of stages that are re-run even if they are cached
+        """
+        self.cache_dir = cache_dir
+        self.n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+        self.force = set(force)
+        self.stages = {}
+        self.keys = {}
+        self.report = RunReport('pipeline')
+
+    def add(self, stage):
+        """Adds a stage; its dependencies must have been added before."""
+        missing = [dep for dep in stage.deps if dep not in self.stages]
+        if missing:
+            raise ValueError(f'Stage {stage.name} depends on unknown stage(s) {missing}')
+        self.stages[stage.name] = stage
+        return stage
+
+    def key(self, name):
+        """Content hash of a stage (memoised)."""
+        if name not in self.keys:
+            stage = self.stages[name]
+            content = {
+                'name': name,
+                'params': stage.params,
+                'files': [file_digest(path, self.cache_dir) for path in stage.files],
+                'code': [hashlib.sha256(inspect.getsource(importlib.import_module(module)).encode()).hexdigest()
+                         for module in stage.modules],
+                'deps': {dep: self.key(dep) for dep in stage.deps},
+            }
+            self.keys[name] = hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return self.keys[name]
+
+    def output_dir(self, name):
+        return os.path.join(self.cache_dir, f"{name.replace('/', '_')}-{self.key(name)}")
+
+    def _is_cached(self, name):
+        if name in self.force:
+            return False
+        output_dir = self.output_dir(name)
+        if not os.path.isdir(output_dir):
+            return False
+        # outputs that reference data deleted since (e.g. a removed store version) are rebuilt
+        valid = self.stages[name].valid
+        if valid is not None and not valid(output_dir):
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return False
+        return True
+
+    def _needed(self, targets):
+        """Stages required for the targets, in dependency order."""
+        needed = []
+
+        def visit(name):
+            if name in needed:
+                return
+            for dep in self.stages[name].deps:
+                visit(dep)
+            needed.append(name)
+
+        for name in targets:
+            visit(name)
+        return needed
+
+    def _finish(self, name, record):
+        shutil.rmtree(self.output_dir(name), ignore_errors=True)
+        os.replace(self.output_dir(name) + '.tmp', self.output_dir(name))
+        record['key'] = self.key(name)
+        self.report.records.append(record)
+
+    def run(self, targets=None):
+        """
+        Runs every stage needed for the targets (all stages by default) that is not cached.
+
+        Returns:
+            dict mapping every needed stage name to its output directory
+        """
+        try:
+            needed = self._needed(list(self.stages) if targets is None else targets)
+            done = set()
+            for name in needed:
+                # a stage whose inputs are rebuilt in this run is rebuilt as well
+                if all(dep in done for dep in self.stages[name].deps) and self._is_cached(name):
+                    logging.info(f'Stage {name}: cached ({self.key(name)})')
+                    self.report.records.append({'name': name, 'parent': None, 'cached': True, 'key': self.key(name)})
+                    done.add(name)
+
+            pending = [name for name in needed if name not in done]
+            running = {}
+            executor = ProcessPoolExecutor(max_workers=self.n_jobs) if self.n_jobs > 1 else None
+            try:
+                while pending or running:
+                    for name in [name for name in pending if all(dep in done for dep in self.stages[name].deps)]:
+                        stage = self.stages[name]
+                        tmp_dir = self.output_dir(name) + '.tmp'
+                        shutil.rmtree(tmp_dir, ignore_errors=True)
+                        os.makedirs(tmp_dir)
+                        dep_outputs = {dep: (self.stages[dep].load, self.output_dir(dep)) for dep in stage.deps}
+                        pending.remove(name)
+                        logging.info(f'Stage {name}: running ({self.key(name)})')
+                        if executor is not None and stage.parallel:
+                            running[executor.submit(_execute, stage, dep_outputs, tmp_dir)] = name
+                        else:
+                            self._finish(name, _execute(stage, dep_outputs, tmp_dir))
+                            done.add(name)
+                    if running:
+                        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            name = running.pop(future)
+                            self._finish(name, future.result())
+                            done.add(name)
+                    elif pending and not any(all(dep in done for dep in self.stages[name].deps) for name in pending):
+                        raise RuntimeError(f'Stages {pending} cannot run, their dependencies did not finish')
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+
+            logging.info('Pipeline Runner Completed Successfully')
+            return {name: self.output_dir(name) for name in needed}
+        except Exception as e:
+            logging.error(f'Error in Pipeline Runner: {e}')
+            raise e
+
+    def load(self, name):
+        """Loads the output of a finished stage."""
+        return self.stages[name].load(self.output_dir(name))
+
+
+# ============= Stages of the training pipeline =============
+def _parse_frame(file_path, name, chunksize, output_dir):
+    frame = ZipDataIngestor(chunksize=chunksize).read_member(file_path, CSV_FRAMES[name])
+    ZipDataIngestor()._save_cache(os.path.join(output_dir, name), **{name: frame})
+    return len(frame)
+
+
+def run_ingest(inputs, output_dir, file_path, chunksize=1_000_000):
+    """Parses links, movies and ratings side by side, each into a columnar .npy cache."""
+    with ProcessPoolExecutor(max_workers=min(len(CSV_FRAMES), os.cpu_count())) as executor:
+        futures = [executor.submit(_parse_frame, file_path, name, chunksize, output_dir) for name in CSV_FRAMES]
+        for future in futures:
+            future.result()
+
+
+def load_ingest(output_dir):
+    ingestor = ZipDataIngestor()
+    return tuple(ingestor._load_frame(os.path.join(output_dir, name), name) for name in CSV_FRAMES)
+
+
+def run_clean(inputs, output_dir, store_dir=DEFAULT_STORE_DIR):
+    """Cleans the frames and builds the user-item matrix into a new artifact store version."""
+    links, movies, ratings = inputs['ingest']
+    # the version is only served once publish has added the neighbour tables
+    data_preprocessor = DataPreprocessing()
+    data_preprocessor.clean(movies, ratings, links, store=ArtifactStore(store_dir), make_current=False)
+    with open(os.path.join(output_dir, 'output.json'), 'w') as f:
+        json.dump({'store_dir': store_dir, 'version': data_preprocessor.version}, f)
+
+
+def load_clean(output_dir):
+    with open(os.path.join(output_dir, 'output.json')) as f:
+        output = json.load(f)
+    return ArtifactStore(output['store_dir']).load(output['version'], mmap_mode='r')
+
+
+def store_version_exists(output_dir):
+    with open(os.path.join(output_dir, 'output.json')) as f:
+        output = json.load(f)
+    return os.path.exists(os.path.join(output['store_dir'], output['version'], 'manifest.json'))
+
+
+def run_neighbours(inputs, output_dir, metric='cosine', algorithm='brute', k=50):
+    """Builds the top-K neighbour table of one metric."""
+    table = NeighbourTableBuilder(k=k).build_table(inputs['clean'].X, metric=metric, algorithm=algorithm)
+    np.save(os.path.join(output_dir, 'indices.npy'), table.indices)
+    np.save(os.path.join(output_dir, 'distances.npy'), table.distances)
+    with open(os.path.join(output_dir, 'output.json'), 'w') as f:
+        json.dump({'metric': metric}, f)
+
+
+def load_neighbours(output_dir):
+    with open(os.path.join(output_dir, 'output.json')) as f:
+        metric = json.load(f)['metric']
+    return NeighbourTable(np.load(os.path.join(output_dir, 'indices.npy'), mmap_mode='r'),
+                          np.load(os.path.join(output_dir, 'distances.npy'), mmap_mode='r'), metric)
+
+
+def run_publish(inputs, output_dir, store_dir=DEFAULT_STORE_DIR):
+    """Derives a store version with the neighbour tables from the cleaned one and makes it the served one."""
+    artifacts = inputs['clean']
+    arrays = {}
+    for name, table in inputs.items():
+        if name.startswith('neighbours'):
+            arrays[f'neighbours_{table.metric}_indices'] = table.indices
+            arrays[f'neighbours_{table.metric}_distances'] = table.distances
+    # versions are never rewritten, so every cached publish keeps pointing at its own tables;
+    # X and the other cleaned arrays are hard-linked, not copied
+    version = ArtifactStore(store_dir).derive(artifacts.version, arrays)
+    with open(os.path.join(output_dir, 'output.json'), 'w') as f:
+        json.dump({'store_dir': store_dir, 'version': version}, f)
+
+
+def training_dag(file_path=os.path.join('data', 'ml-latest.zip'), metrics=None, n_neighbours=50,
+                 store_dir=DEFAULT_STORE_DIR, cache_dir=DEFAULT_CACHE_DIR, n_jobs=-1, force=()):
+    """
+    Builds the runner for ingest -> clean (incl. the user-item matrix) -> neighbour tables -> publish.
+
+    Args:
+        file_path: MovieLens zip
+        metrics: dict mapping metric to kNN algorithm (defaults to SUPPORTED_METRICS)
+        n_neighbours: neighbours stored per item
+        store_dir: artifact store the outputs are published to
+        cache_dir: directory of the stage outputs
+        n_jobs: worker processes for the parallel stages
+        force: names of stages to re-run
+
+    Returns:
+        PipelineRunner
+    """
+    metrics = SUPPORTED_METRICS if metrics is None else metrics
+    runner = PipelineRunner(cache_dir=cache_dir, n_jobs=n_jobs, force=force)
+    runner.add(Stage('ingest', run_ingest, load_ingest, params={'file_path': file_path},
+                     files=(file_path,), modules=('pipeline.runner', 'src.data_ingestion')))
+    runner.add(Stage('clean', run_clean, load_clean, deps=('ingest',), params={'store_dir': store_dir},
+                     valid=store_version_exists,
+                     modules=('pipeline.runner', 'src.data_preprocessing', 'src.artifact_store', 'src.id_mapper')))
+    index_modules = ('pipeline.runner', 'src.neighbour_table', 'src.similarity_index', 'src.cosine_engine',
+                     'src.sharded_index', 'src.ann_index', 'src.als', 'src.id_mapper')
+    for metric, algorithm in metrics.items():
+        runner.add(Stage(f'neighbours[{metric}]', run_neighbours, load_neighbours, deps=('clean',),
+                         params={'metric': metric, 'algorithm': algorithm, 'k': n_neighbours},
+                         modules=index_modules, parallel=True))
+    runner.add(Stage('publish', run_publish, load_clean,
+                     deps=('clean',) + tuple(f'neighbours[{metric}]' for metric in metrics),
+                     params={'store_dir': store_dir}, modules=('pipeline.runner', 'src.artifact_store'),
+                     valid=store_version_exists))
+    return runner
+
+
+def cached_training_pipeline(movie_id:int, k=10, metric='cosine', algorithm='brute', n_neighbours=50,
+                             file_path=os.path.join('data', 'ml-latest.zip'), store_dir=DEFAULT_STORE_DIR,
+                             n_jobs=-1, force=()):
+    """Same result as training_pipeline, with every unchanged stage served from the pipeline cache."""
+    try:
+        runner = training_dag(file_path=file_path, n_neighbours=n_neighbours, store_dir=store_dir,
+                              n_jobs=n_jobs, force=force)
+        runner.run()
+        runner.report.save()
+        artifacts = runner.load('publish')
+        # a cached publish may not be the served version any more
+        ArtifactStore(store_dir).set_current(artifacts.version)
+
+        # Serve from the neighbour table when it covers the request, otherwise fit the index once
+        index = None
+        if algorithm not in ('ann', 'als') and f'neighbours[{metric}]' in runner.stages:
+            index = runner.load(f'neighbours[{metric}]')
+        if index is None or index.n_neighbors < k + 1:
+            index = build_similarity_index(artifacts.X, metric=metric, algorithm=algorithm)
+
+        model_trainer = ModelTraining(
+            movie_id=movie_id,
+            X=artifacts.X,
+            movie_mapper=artifacts.movie_mapper,
+            movie_inv_mapper=artifacts.movie_inv_mapper,
+            k=k,
+            metric=metric,
+            algorithm=algorithm,
+            index=index
+        )
+        movie_titles = dict(zip(artifacts.movies['movieId'], artifacts.movies['title']))
+        return model_trainer.recommend(movie_titles)
+    except Exception as e:
+        logging.error(f'Error in Cached Training Pipeline: {e}')
+        raise e
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the training pipeline, skipping unchanged stages")
+    parser.add_argument('--file-path', default=os.path.join('data', 'ml-latest.zip'), help="MovieLens zip")
+    parser.add_argument('--movie-id', type=int, default=1)
+    parser.add_argument('--n-neighbours', type=int, default=50, help="neighbours stored per item")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="worker processes (-1 uses all cores)")
+    parser.add_argument('--force', nargs='*', default=(), help="stages to re-run (e.g. clean)")
+    args = parser.parse_args()
+    cached_training_pipeline(args.movie_id, n_neighbours=args.n_neighbours, file_path=args.file_path,
+                             n_jobs=args.n_jobs, force=args.force)
@@ -1,28 +1,69 @@
 import logging
+import os
 import gc
 
 from src.data_ingestion import ZipDataIngestor
 from src.data_preprocessing import DataPreprocessing
 from src.model_training import ModelTraining
+from src.similarity_index import build_similarity_index
+from src.neighbour_table import NeighbourTableBuilder
+from src.artifact_store import ArtifactStore
+from src.ann_index import evaluate_recall
+from src.instrumentation import RunReport
 
 # Setup logging Configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-def training_pipeline(movie_id:int, k=10, metric='cosine', algorithm='brute'):
+def training_pipeline(movie_id:int, k=10, metric='cosine', algorithm='brute', build_neighbours=True, n_neighbours=50,
+                      profile=None, n_workers=None):
+    # Per-stage wall/CPU time, memory and counts, saved to artifacts/reports (profile: stage names or 'all')
+    # n_workers: worker processes sharing X in shared memory for the exact neighbour tables (-1 uses all cores)
+    report = RunReport('training', profile=profile).activate()
     try:
         # Ingest the data
         logging.info('[Ingest the data]')
-        data_ingestor = ZipDataIngestor()
-        file_path = r'.\data\ml-latest.zip'
-        links, movies, ratings = data_ingestor.ingest(file_path)
+        with report.stage('ingest') as record:
+            data_ingestor = ZipDataIngestor(stream=True, cache_dir=os.path.join('data', 'cache'))
+            file_path = os.path.join('data', 'ml-latest.zip')
+            links, movies, ratings = data_ingestor.ingest(file_path)
+            record.update(ratings=len(ratings), movies=len(movies), links=len(links))
         # Clean the data
         logging.info('[Clean the data]')
-        data_preprocessor = DataPreprocessing()
-        cleaned_data, X, movie_mapper, movie_inv_mapper = data_preprocessor.clean(movies, ratings, links)
+        with report.stage('clean') as record:
+            store = ArtifactStore()
+            data_preprocessor = DataPreprocessing()
+            cleaned_data, X, movie_mapper, movie_inv_mapper = data_preprocessor.clean(movies, ratings, links, store=store)
+            record.update(rows=len(cleaned_data), nnz=int(X.nnz), users=X.shape[0], items=X.shape[1])
         
         del movies, ratings, links, data_ingestor, data_preprocessor
         gc.collect()
         
+        # Precompute the top-K neighbour tables of every supported metric
+        tables = {}
+        if build_neighbours:
+            logging.info('[Build the neighbour tables]')
+            with report.stage('neighbour tables', k=n_neighbours):
+                tables = NeighbourTableBuilder(k=n_neighbours, n_workers=n_workers).build(X, store=store)
+        
+        # Serve from the neighbour table when it covers the request, otherwise fit the index once
+        index = tables.get(metric) if algorithm not in ('ann', 'als') else None
+        if index is None or index.n_neighbors < k + 1:
+            logging.info('[Fit the similarity index]')
+            with report.stage('fit', metric=metric, algorithm=algorithm):
+                index = build_similarity_index(X, metric=metric, algorithm=algorithm)
+        
+        # Keep the latent factors with the artifacts so serving does not retrain
+        if algorithm == 'als':
+            index.save(store)
+        
+        # Report how close the approximate backend gets to exact kNN
+        if algorithm == 'ann':
+            exact_index = tables.get(metric)
+            if exact_index is None or exact_index.n_neighbors < k + 1:
+                exact_index = build_similarity_index(X, metric=metric, algorithm='brute')
+            evaluate_recall(index, exact_index, k=k)
+            del exact_index
+        
         # Train the model
         logging.info('[Train the model]')
         model_trainer = ModelTraining(
@@ -32,20 +73,25 @@ def training_pipeline(movie_id:int, k=10, metric='cosine', algorithm='brute'):
             movie_inv_mapper=movie_inv_mapper,
             k=k,
             metric=metric,
-            algorithm=algorithm
+            algorithm=algorithm,
+            index=index
         )
         
         # movie_titles mapping
         movie_titles = dict(zip(cleaned_data['movieId'], cleaned_data['title']))
         
         # Get the recommendations
-        recommendations = model_trainer.recommend(movie_titles)
+        with report.stage('query', k=k):
+            recommendations = model_trainer.recommend(movie_titles)
         
-        del cleaned_data, X, movie_mapper, movie_inv_mapper, movie_titles, model_trainer
+        del cleaned_data, X, movie_mapper, movie_inv_mapper, movie_titles, model_trainer, index, tables
         gc.collect()
         
         logging.info('Training Pipeline Completed Successfully')
+        report.save()
         return recommendations
     except Exception as e:
         logging.error(f'Error in Training Pipeline: {e}')
-        raise e
\ No newline at end of file
+        raise e
+    finally:
+        report.deactivate()
\ No newline at end of file
@@ -0,0 +1,13 @@
+import argparse
+from src.artifact_store import ArtifactStore, DEFAULT_STORE_DIR
+from src.recommendation_service import run_server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Headless HTTP recommendation service")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--store-dir', default=DEFAULT_STORE_DIR, help="artifact store directory")
+    parser.add_argument('--max-batch-size', type=int, default=256, help="maximum requests per kNN call")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help="time spent filling a batch")
+    args = parser.parse_args()
+    run_server(args.host, args.port, ArtifactStore(args.store_dir), args.max_batch_size, args.max_wait_ms)
@@ -0,0 +1,195 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix
+from src.artifact_store import ArtifactStore
+from src.cosine_engine import top_n
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Arrays saved with an artifact version by ALSModel.save
+ALS_ARRAYS = ('als_user_factors', 'als_item_factors', 'als_global_mean')
+
+
+# Create Class for the Matrix-Factorization Model (ALS)
+class ALSModel:
+    def __init__(self, X, n_factors=64, regularization=0.1, n_iter=10, n_jobs=-1, chunk_size=1024,
+                 random_state=0):
+        """
+        Latent-factor model of X trained with alternating least squares.
+
+        Ratings are centred on the global mean and factorised as X ~ mean + U V^T. Each
+        iteration solves every user row against the fixed item factors (CSR layout of X)
+        and every item column against the fixed user factors (CSR layout of X^T), with
+        the regularisation scaled by the number of ratings of the row. The small
+        per-row systems are solved in chunks on a thread pool (NumPy releases the GIL).
+
+        Item similarities are cosine similarities of the item factors, so the model
+        exposes the same kneighbors contract as the similarity indexes.
+
+        Args:
+            X: user-item utility matrix (users x items)
+            n_factors: dimension of the user and item factors
+            regularization: L2 penalty per rating
+            n_iter: number of alternating iterations
+            n_jobs: number of solver threads (-1 uses all cores)
+            chunk_size: rows solved per thread task
+            random_state: seed of the item factor initialisation
+        """
+        self.X = X
+        self.metric = 'cosine'
+        self.algorithm = 'als'
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.n_iter = n_iter
+        self.n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+        self.global_mean = 0.0
+        self.user_factors = None
+        self.item_factors = None
+        self.normalized_items = None
+
+    @property
+    def n_items(self):
+        return self.X.shape[1]
+
+    def _solve_chunk(self, matrix, fixed, start, stop, out):
+        """Solves the regularised least-squares problems of rows [start, stop) of matrix."""
+        n_factors = fixed.shape[1]
+        indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+        gram = np.empty((stop - start, n_factors, n_factors))
+        rhs = np.empty((stop - start, n_factors))
+        for row in range(start, stop):
+            cols = indices[indptr[row]:indptr[row + 1]]
+            factors = fixed[cols]
+            gram[row - start] = factors.T @ factors
+            rhs[row - start] = data[indptr[row]:indptr[row + 1]] @ factors
+        counts = np.maximum(np.diff(indptr[start:stop + 1]), 1)
+        gram += (self.regularization * counts)[:, None, None] * np.eye(n_factors)
+        out[start:stop] = np.linalg.solve(gram, rhs[..., None])[..., 0]
+
+    def _solve(self, matrix, fixed, executor):
+        """Solves every row of matrix against the fixed factors of its columns."""
+        out = np.empty((matrix.shape[0], fixed.shape[1]))
+        futures = [executor.submit(self._solve_chunk, matrix, fixed, start,
+                                   min(start + self.chunk_size, matrix.shape[0]), out)
+                   for start in range(0, matrix.shape[0], self.chunk_size)]
+        for future in futures:
+            future.result()
+        return out
+
+    def fit(self):
+        """Alternates user and item solves and keeps the factors as float32."""
+        try:
+            user_matrix = csr_matrix(self.X, dtype=np.float64, copy=True)
+            self.global_mean = float(user_matrix.data.mean()) if user_matrix.nnz else 0.0
+            user_matrix.data -= self.global_mean
+            item_matrix = user_matrix.T.tocsr()
+
+            rng = np.random.default_rng(self.random_state)
+            item_factors = rng.normal(scale=1 / np.sqrt(self.n_factors), size=(self.n_items, self.n_factors))
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                for iteration in range(self.n_iter):
+                    user_factors = self._solve(user_matrix, item_factors, executor)
+                    item_factors = self._solve(item_matrix, user_factors, executor)
+                    logging.info(f'ALS iteration {iteration + 1}/{self.n_iter}: '
+                                 f'train RMSE {self._rmse(user_matrix, user_factors, item_factors):.4f}')
+
+            self._set_factors(user_factors, item_factors)
+            logging.info(f'ALS Model Fitted: {self.X.shape[0]:,} users, {self.n_items:,} items, {self.n_factors} factors')
+            return self
+        except Exception as e:
+            logging.error(f'Error in Fitting ALS Model: {e}')
+            raise e
+
+    def _rmse(self, user_matrix, user_factors, item_factors, sample=100_000):
+        """RMSE of the centred ratings on (a sample of) the training entries."""
+        rows = np.repeat(np.arange(user_matrix.shape[0]), np.diff(user_matrix.indptr))
+        positions = np.arange(user_matrix.nnz)
+        if user_matrix.nnz > sample:
+            positions = np.random.default_rng(0).choice(user_matrix.nnz, sample, replace=False)
+        predictions = np.einsum('ij,ij->i', user_factors[rows[positions]], item_factors[user_matrix.indices[positions]])
+        return float(np.sqrt(np.mean((user_matrix.data[positions] - predictions) ** 2)))
+
+    def _set_factors(self, user_factors, item_factors):
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        norms = np.linalg.norm(self.item_factors, axis=1, keepdims=True)
+        self.normalized_items = self.item_factors / np.maximum(norms, 1e-12)
+
+    def kneighbors(self, item_indices, n_neighbors, return_distance=True, block_size=1024):
+        """
+        Finds the nearest items by cosine distance of the item factors.
+
+        Args:
+            item_indices: int or array of item (column) indices of X
+            n_neighbors: number of neighbours to return per item
+            return_distance: whether to return the cosine distances as well
+
+        Returns:
+            distances (if return_distance) and neighbour item indices, both of shape (n_queries, n_neighbors)
+        """
+        if self.item_factors is None:
+            self.fit()
+        item_indices = np.atleast_1d(np.asarray(item_indices, dtype=np.int64))
+        n_neighbors = min(n_neighbors, self.n_items)
+        neighbours = np.empty((len(item_indices), n_neighbors), dtype=np.int64)
+        distances = np.empty((len(item_indices), n_neighbors), dtype=np.float32)
+        for start in range(0, len(item_indices), block_size):
+            block = item_indices[start:start + block_size]
+            similarities = self.normalized_items[block] @ self.normalized_items.T
+            # the query item always comes first, as with the exact indexes
+            similarities[np.arange(len(block)), block] = np.inf
+            block_neighbours, block_similarities = top_n(similarities, n_neighbors)
+            block_similarities[:, 0] = 1.0
+            neighbours[start:start + len(block)] = block_neighbours
+            distances[start:start + len(block)] = 1.0 - block_similarities
+        if return_distance:
+            return distances, neighbours
+        return neighbours
+
+    def recommend(self, user_indices, n=12, exclude_seen=True):
+        """
+        Ranks the items of many users by predicted rating.
+
+        Args:
+            user_indices: int or array of user (row) indices of X
+            n: number of recommendations per user
+            exclude_seen: whether the user's rated items are left out
+
+        Returns:
+            item indices and predicted ratings of shape (n_users, n), best first
+        """
+        if self.user_factors is None:
+            self.fit()
+        user_indices = np.atleast_1d(np.asarray(user_indices, dtype=np.int64))
+        scores = self.user_factors[user_indices] @ self.item_factors.T + self.global_mean
+        if exclude_seen:
+            seen = self.X[user_indices]
+            scores[np.repeat(np.arange(len(user_indices)), np.diff(seen.indptr)), seen.indices] = -np.inf
+        return top_n(scores, n)
+
+    def save(self, store=None):
+        """Adds the factors to the current artifact store version."""
+        store = ArtifactStore() if store is None else store
+        store.save_arrays({'als_user_factors': self.user_factors,
+                           'als_item_factors': self.item_factors,
+                           'als_global_mean': np.array([self.global_mean], dtype=np.float32)})
+
+    @classmethod
+    def from_arrays(cls, arrays, X):
+        """Builds a fitted model from a dict of named arrays (e.g. Artifacts.arrays), None if it is missing."""
+        if any(arrays.get(name) is None for name in ALS_ARRAYS):
+            return None
+        # factors fitted on another shape of X (e.g. before users were added) cannot serve it
+        if (arrays['als_user_factors'].shape[0], arrays['als_item_factors'].shape[0]) != X.shape:
+            logging.warning(f"Ignoring saved ALS factors: fitted on {arrays['als_user_factors'].shape[0]} users x "
+                            f"{arrays['als_item_factors'].shape[0]} items, X is {X.shape[0]} x {X.shape[1]}")
+            return None
+        model = cls(X, n_factors=arrays['als_item_factors'].shape[1])
+        model.global_mean = float(arrays['als_global_mean'][0])
+        model._set_factors(arrays['als_user_factors'], arrays['als_item_factors'])
+        return model
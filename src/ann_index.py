@@ -0,0 +1,179 @@
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.metrics import pairwise_distances
+from sklearn.preprocessing import normalize
+from sklearn.utils.extmath import randomized_svd
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Create Class for the Approximate Nearest-Neighbour Index
+class ANNIndex:
+    def __init__(self, X, metric='cosine', n_components=64, n_lists=None, n_probe=8, rerank=True,
+                 n_iter=10, random_state=0):
+        """
+        Approximate item-item kNN: truncated SVD embeddings indexed with an IVF cluster index.
+
+        Item columns are reduced to dense n_components-dimensional embeddings, which are
+        clustered with k-means into n_lists inverted lists. A query only scores the items
+        of its n_probe closest lists, with the exact metric on the raw sparse item vectors
+        (rerank) or, without rerank, in the embedding space. Embedding distances alone miss
+        many of the exact neighbours, so by default they only select the candidates.
+
+        Args:
+            X: user-item utility matrix (users x items)
+            metric: distance metric ('cosine', 'euclidean' or 'manhattan')
+            n_components: dimension of the item embeddings
+            n_lists: number of IVF lists (4 * sqrt(n_items) if None)
+            n_probe: number of lists scanned per query
+            rerank: whether candidates are ranked with the exact metric on the raw vectors (keeps them in memory)
+            n_iter: number of k-means iterations
+            random_state: seed of the SVD and the k-means initialisation
+        """
+        self.X = X
+        self.metric = metric
+        self.algorithm = 'ann'
+        self.n_components = n_components
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.rerank = rerank
+        self.n_iter = n_iter
+        self.random_state = random_state
+        self.embeddings = None
+        self.item_matrix = None
+
+    @property
+    def n_items(self):
+        return self.X.shape[1]
+
+    def _kmeans(self, data, n_clusters, rng):
+        """Lloyd's k-means in NumPy, returns the centroids and the cluster of every row."""
+        centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+        squared_norms = np.einsum('ij,ij->i', data, data)
+        for _ in range(self.n_iter):
+            assign = self._nearest_centroids(data, centroids, squared_norms)
+            counts = np.bincount(assign, minlength=n_clusters)
+            members = csr_matrix((np.ones(len(data), dtype=data.dtype), (assign, np.arange(len(data)))),
+                                 shape=(n_clusters, len(data)))
+            sums = members @ data
+            # empty clusters keep their previous centroid
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids, self._nearest_centroids(data, centroids, squared_norms)
+
+    def _nearest_centroids(self, data, centroids, squared_norms, block_size=65536):
+        assign = np.empty(len(data), dtype=np.int64)
+        centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+        for start in range(0, len(data), block_size):
+            block = data[start:start + block_size]
+            distances = squared_norms[start:start + block_size, None] - 2 * block @ centroids.T + centroid_norms
+            assign[start:start + block_size] = distances.argmin(axis=1)
+        return assign
+
+    def fit(self):
+        """Computes the item embeddings and builds the IVF lists."""
+        try:
+            rng = np.random.default_rng(self.random_state)
+            item_matrix = csr_matrix(self.X.T, dtype=np.float64)
+            if self.metric == 'cosine':
+                item_matrix = normalize(item_matrix, norm='l2', axis=1)
+            # the raw item vectors are only read when the candidates are re-ranked
+            self.item_matrix = item_matrix if self.rerank else None
+
+            n_components = min(self.n_components, min(item_matrix.shape) - 1)
+            U, S, _ = randomized_svd(item_matrix, n_components=n_components, random_state=self.random_state)
+            embeddings = (U * S).astype(np.float32)
+            if self.metric == 'cosine':
+                embeddings = normalize(embeddings, norm='l2', axis=1)
+            self.embeddings = embeddings
+
+            n_lists = self.n_lists or int(4 * np.sqrt(self.n_items))
+            n_lists = max(1, min(n_lists, self.n_items))
+            self.centroids, assign = self._kmeans(embeddings, n_lists, rng)
+            # inverted lists: items sorted by cluster, list i is list_items[list_offsets[i]:list_offsets[i+1]]
+            self.list_items = np.argsort(assign, kind='stable')
+            self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assign, minlength=n_lists))))
+            logging.info(f'ANN Index Fitted: metric:{self.metric}, components:{n_components}, lists:{n_lists}, probe:{self.n_probe}, rerank:{self.rerank}')
+            return self
+        except Exception as e:
+            logging.error(f'Error in Fitting ANN Index: {e}')
+            raise e
+
+    def _candidates(self, query_embedding, n_neighbors):
+        """Items of the n_probe lists closest to the query, widened until there are enough of them."""
+        centroid_distances = ((self.centroids - query_embedding) ** 2).sum(axis=1)
+        order = np.argsort(centroid_distances)
+        n_probe = self.n_probe
+        while True:
+            lists = order[:n_probe]
+            candidates = np.concatenate([self.list_items[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+            if len(candidates) >= n_neighbors or n_probe >= len(order):
+                return candidates
+            n_probe *= 2
+
+    def kneighbors(self, item_indices, n_neighbors, return_distance=True):
+        """
+        Finds the approximate nearest items for the given item indices.
+
+        Args:
+            item_indices: int or array of item (column) indices of X
+            n_neighbors: number of neighbours to return per item
+            return_distance: whether to return the distances as well
+
+        Returns:
+            distances (if return_distance) and neighbour item indices, both of shape (n_queries, n_neighbors)
+        """
+        if self.embeddings is None:
+            self.fit()
+        item_indices = np.atleast_1d(np.asarray(item_indices, dtype=np.int64))
+        n_neighbors = min(n_neighbors, self.n_items)
+        distances = np.empty((len(item_indices), n_neighbors), dtype=np.float64)
+        neighbours = np.empty((len(item_indices), n_neighbors), dtype=np.int64)
+
+        for row, item in enumerate(item_indices):
+            candidates = self._candidates(self.embeddings[item], n_neighbors)
+            if self.rerank:
+                candidate_distances = pairwise_distances(self.item_matrix[item], self.item_matrix[candidates],
+                                                         metric=self.metric)[0]
+            elif self.metric == 'cosine':
+                candidate_distances = 1.0 - self.embeddings[candidates] @ self.embeddings[item]
+            else:
+                candidate_distances = pairwise_distances(self.embeddings[item][None], self.embeddings[candidates],
+                                                         metric=self.metric)[0]
+            top = np.argpartition(candidate_distances, n_neighbors - 1)[:n_neighbors] \
+                if n_neighbors < len(candidates) else np.arange(len(candidates))
+            top = top[np.argsort(candidate_distances[top], kind='stable')]
+            distances[row], neighbours[row] = candidate_distances[top], candidates[top]
+
+        if return_distance:
+            return distances, neighbours
+        return neighbours
+
+
+def recall_at_k(approximate, exact):
+    """Mean share of the exact neighbours found by the approximate ones, both of shape (n_queries, k)."""
+    hits = [len(np.intersect1d(a, e)) for a, e in zip(approximate, exact)]
+    return float(np.mean(hits) / exact.shape[1])
+
+
+def evaluate_recall(ann_index, exact_index, k=10, n_queries=500, random_state=0):
+    """
+    Reports recall@k of an approximate index against an exact one on sampled items.
+
+    Args:
+        ann_index: fitted ANNIndex
+        exact_index: fitted exact index (or NeighbourTable) with the same metric
+        k: number of neighbours compared (the query item itself excluded)
+        n_queries: number of sampled query items
+
+    Returns:
+        recall: recall@k in [0, 1]
+    """
+    rng = np.random.default_rng(random_state)
+    queries = rng.choice(ann_index.n_items, min(n_queries, ann_index.n_items), replace=False)
+    approximate = ann_index.kneighbors(queries, k + 1, return_distance=False)[:, 1:]
+    exact = exact_index.kneighbors(queries, k + 1, return_distance=False)[:, 1:]
+    recall = recall_at_k(approximate, exact)
+    logging.info(f'ANN recall@{k} vs exact kNN ({ann_index.metric}): {recall:.3f} over {len(queries)} queries')
+    return recall
@@ -0,0 +1,291 @@
+import argparse
+import json
+import logging
+import os
+import pickle
+import shutil
+from datetime import datetime, timezone
+from typing import Dict, NamedTuple
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from src.id_mapper import IdMapper
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_STORE_DIR = os.path.join('artifacts', 'store')
+
+# Artifacts loaded from one store version
+class Artifacts(NamedTuple):
+    movies: pd.DataFrame
+    X: csr_matrix
+    movie_mapper: IdMapper
+    user_mapper: IdMapper
+    arrays: Dict[str, np.ndarray]
+    manifest: dict
+    version: str
+
+    @property
+    def movie_inv_mapper(self):
+        return self.movie_mapper.inverse
+
+
+# Create Class for the Artifact Store
+class ArtifactStore:
+    def __init__(self, root=DEFAULT_STORE_DIR):
+        """
+        Versioned, pickle-free artifact store built on raw .npy files.
+
+        Every version is a directory holding the CSR arrays of X, the sorted user and
+        movie id arrays, one array per movies column and any extra named arrays, plus
+        a manifest.json describing them. The CURRENT file names the version served.
+        Loading memory-maps the arrays, so several processes share the same pages.
+
+        Args:
+            root: directory holding the versions
+        """
+        self.root = root
+
+    def versions(self):
+        """Returns the saved versions, oldest first."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if d.startswith('v') and
+                      os.path.exists(os.path.join(self.root, d, 'manifest.json')))
+
+    def current_version(self):
+        """Returns the version named by CURRENT, or None if nothing has been saved."""
+        current_path = os.path.join(self.root, 'CURRENT')
+        if not os.path.exists(current_path):
+            return None
+        with open(current_path) as f:
+            return f.read().strip() or None
+
+    def _version_dir(self, version):
+        return os.path.join(self.root, version)
+
+    def _write_json(self, path, content):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(content, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _write_array(self, version_dir, manifest, name, array):
+        file_name = f'{name}.npy'
+        np.save(os.path.join(version_dir, file_name), np.ascontiguousarray(array))
+        manifest['arrays'][name] = {'file': file_name, 'dtype': str(array.dtype), 'shape': list(array.shape)}
+
+    def read_manifest(self, version=None):
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"No artifacts saved in {self.root}")
+        with open(os.path.join(self._version_dir(version), 'manifest.json')) as f:
+            return json.load(f)
+
+    def set_current(self, version):
+        """Points CURRENT at the given version."""
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = os.path.join(self.root, 'CURRENT.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(self.root, 'CURRENT'))
+
+    def save(self, X, movie_mapper, user_mapper, movies, arrays=None, parent=None, make_current=True):
+        """
+        Saves a new artifact version.
+
+        Args:
+            X: user-item utility matrix (CSR)
+            movie_mapper: IdMapper of the movie (column) id's
+            user_mapper: IdMapper of the user (row) id's
+            movies: processed movies dataframe
+            arrays: optional dict of extra named arrays (e.g. neighbour tables)
+            parent: version this one was derived from
+            make_current: whether CURRENT should point at the new version
+
+        Returns:
+            version: name of the saved version
+        """
+        try:
+            existing = self.versions()
+            version = f'v{int(existing[-1][1:]) + 1 if existing else 1:04d}'
+            version_dir = self._version_dir(version)
+            os.makedirs(version_dir)
+
+            X = csr_matrix(X)
+            manifest = {
+                'version': version,
+                'parent': parent,
+                'created': datetime.now(timezone.utc).isoformat(),
+                'shape': list(X.shape),
+                'nnz': int(X.nnz),
+                'movies_columns': [],
+                'arrays': {},
+            }
+            self._write_array(version_dir, manifest, 'X_data', X.data)
+            self._write_array(version_dir, manifest, 'X_indices', X.indices)
+            self._write_array(version_dir, manifest, 'X_indptr', X.indptr)
+            self._write_array(version_dir, manifest, 'movie_ids', np.asarray(movie_mapper.ids))
+            self._write_array(version_dir, manifest, 'user_ids', np.asarray(user_mapper.ids))
+
+            for column in movies.columns:
+                values = movies[column]
+                if pd.api.types.is_numeric_dtype(values):
+                    kind, array = 'numeric', values.to_numpy()
+                else:
+                    # strings are stored fixed-width so they can be memory-mapped, missing values as ''
+                    kind, array = 'str', values.fillna('').astype(str).to_numpy(dtype=str)
+                manifest['movies_columns'].append({'name': column, 'kind': kind})
+                self._write_array(version_dir, manifest, f'movies_{column}', array)
+
+            for name, array in (arrays or {}).items():
+                self._write_array(version_dir, manifest, name, np.asarray(array))
+
+            self._write_json(os.path.join(version_dir, 'manifest.json'), manifest)
+            if make_current:
+                self.set_current(version)
+            logging.info(f"Saved artifact version {version} to {version_dir}")
+            return version
+        except Exception as e:
+            logging.error(f'Error in Saving Artifacts: {e}')
+            raise e
+
+    def derive(self, base_version, arrays, make_current=True):
+        """
+        Saves a new version holding the arrays of base_version plus extra (or replaced) named arrays.
+
+        The unchanged arrays are hard-linked instead of copied where the file system allows it,
+        so deriving a version never duplicates X on disk and leaves base_version untouched.
+
+        Args:
+            base_version: version whose arrays are carried over
+            arrays: dict of extra named arrays (e.g. neighbour tables)
+            make_current: whether CURRENT should point at the new version
+
+        Returns:
+            version: name of the saved version
+        """
+        try:
+            base = self.read_manifest(base_version)
+            existing = self.versions()
+            version = f'v{int(existing[-1][1:]) + 1:04d}'
+            version_dir = self._version_dir(version)
+            os.makedirs(version_dir)
+
+            manifest = dict(base, version=version, parent=base['version'],
+                            created=datetime.now(timezone.utc).isoformat(), arrays={})
+            for name, entry in base['arrays'].items():
+                # replaced arrays are not linked, writing them would go through to the base version's file
+                if name in arrays:
+                    continue
+                source = os.path.join(self._version_dir(base['version']), entry['file'])
+                try:
+                    os.link(source, os.path.join(version_dir, entry['file']))
+                except OSError:
+                    shutil.copyfile(source, os.path.join(version_dir, entry['file']))
+                manifest['arrays'][name] = entry
+            for name, array in arrays.items():
+                self._write_array(version_dir, manifest, name, np.asarray(array))
+
+            self._write_json(os.path.join(version_dir, 'manifest.json'), manifest)
+            if make_current:
+                self.set_current(version)
+            logging.info(f"Saved artifact version {version} to {version_dir} (derived from {base['version']})")
+            return version
+        except Exception as e:
+            logging.error(f'Error in Deriving Artifacts: {e}')
+            raise e
+
+    def save_arrays(self, arrays, version=None):
+        """Adds extra named arrays to an existing version (the current one by default)."""
+        manifest = self.read_manifest(version)
+        version_dir = self._version_dir(manifest['version'])
+        for name, array in arrays.items():
+            self._write_array(version_dir, manifest, name, np.asarray(array))
+            logging.info(f"Saved: {name}.npy ({manifest['version']})")
+        self._write_json(os.path.join(version_dir, 'manifest.json'), manifest)
+
+    def load_array(self, name, version=None, mmap_mode='r', manifest=None):
+        """Loads one named array, returns None if the version does not hold it."""
+        manifest = manifest or self.read_manifest(version)
+        entry = manifest['arrays'].get(name)
+        if entry is None:
+            return None
+        return np.load(os.path.join(self._version_dir(manifest['version']), entry['file']), mmap_mode=mmap_mode)
+
+    def load(self, version=None, mmap_mode='r'):
+        """
+        Loads an artifact version (the current one by default).
+
+        Args:
+            version: version to load
+            mmap_mode: mode passed to np.load, 'r' shares read-only pages between processes
+
+        Returns:
+            Artifacts with the movies frame, X, the id mappers and the extra arrays
+        """
+        try:
+            manifest = self.read_manifest(version)
+            load = lambda name: self.load_array(name, mmap_mode=mmap_mode, manifest=manifest)
+
+            X = csr_matrix((load('X_data'), load('X_indices'), load('X_indptr')),
+                           shape=tuple(manifest['shape']), copy=False)
+
+            movies = {}
+            for column in manifest['movies_columns']:
+                values = load(f"movies_{column['name']}")
+                if column['kind'] == 'str':
+                    values = pd.Series(values, dtype=object).replace('', np.nan)
+                movies[column['name']] = values
+            movies = pd.DataFrame(movies)
+
+            core = {'X_data', 'X_indices', 'X_indptr', 'movie_ids', 'user_ids'}
+            arrays = {name: load(name) for name in manifest['arrays']
+                      if name not in core and not name.startswith('movies_')}
+
+            logging.info(f"Loaded artifact version {manifest['version']} ({manifest['nnz']:,} ratings)")
+            return Artifacts(movies, X, IdMapper(load('movie_ids')), IdMapper(load('user_ids')),
+                             arrays, manifest, manifest['version'])
+        except Exception as e:
+            logging.error(f'Error in Loading Artifacts: {e}')
+            raise e
+
+    def convert_pickles(self, artifacts_dir='artifacts'):
+        """
+        One-off conversion of the legacy pickled artifacts into a store version.
+
+        Reads movies_processed.pkl, X_matrix.pkl and the movie mapper (movie_ids.npy or
+        movie_mapper.pkl). User id's were never pickled, so positional ones are used
+        unless user_ids.npy exists.
+
+        Returns:
+            version: name of the saved version
+        """
+        movies = pd.read_pickle(os.path.join(artifacts_dir, 'movies_processed.pkl'))
+        with open(os.path.join(artifacts_dir, 'X_matrix.pkl'), 'rb') as f:
+            X = pickle.load(f)
+
+        movie_ids_path = os.path.join(artifacts_dir, 'movie_ids.npy')
+        if os.path.exists(movie_ids_path):
+            movie_mapper = IdMapper(np.load(movie_ids_path))
+        else:
+            with open(os.path.join(artifacts_dir, 'movie_mapper.pkl'), 'rb') as f:
+                movie_mapper = IdMapper.from_dict(pickle.load(f))
+
+        user_ids_path = os.path.join(artifacts_dir, 'user_ids.npy')
+        if os.path.exists(user_ids_path):
+            user_mapper = IdMapper(np.load(user_ids_path))
+        else:
+            user_mapper = IdMapper(np.arange(X.shape[0], dtype=np.int64))
+
+        logging.info(f"Converting pickled artifacts from {artifacts_dir}")
+        return self.save(X, movie_mapper, user_mapper, movies)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert the pickled artifacts into the memory-mapped artifact store")
+    parser.add_argument('--artifacts-dir', default='artifacts', help="directory holding the legacy pickles")
+    parser.add_argument('--store-dir', default=DEFAULT_STORE_DIR, help="artifact store directory")
+    args = parser.parse_args()
+    ArtifactStore(args.store_dir).convert_pickles(args.artifacts_dir)
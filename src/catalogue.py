@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+# Create Class for the Serving Catalogue
+class ServingCatalogue:
+    def __init__(self, movies:pd.DataFrame):
+        """
+        Lookup structures over the processed movies frame, built once at load time.
+
+        Holds a title -> movieId dict, a hashed movieId -> row position index and the
+        served columns as contiguous arrays, so hydrating a result set is one
+        vectorized fancy-index instead of one DataFrame scan per movie.
+
+        Args:
+            movies: processed movies dataframe (movieId, title, year, avg_rating, movie_id)
+        """
+        self.movie_ids = movies['movieId'].to_numpy()
+        self.titles = movies['title'].to_numpy(dtype=object)
+        self.years = movies['year'].to_numpy(dtype=object) if 'year' in movies else np.full(len(movies), np.nan, dtype=object)
+        self.avg_ratings = movies['avg_rating'].to_numpy(dtype=np.float64) if 'avg_rating' in movies else np.zeros(len(movies))
+        self.tmdb_ids = movies['movie_id'].to_numpy(dtype=np.float64) if 'movie_id' in movies else np.full(len(movies), np.nan)
+
+        # first row wins for duplicated titles / movieIds, as the old .iloc[0] lookups did
+        self.title_index = {}
+        for position, title in enumerate(self.titles):
+            self.title_index.setdefault(title, position)
+        first_rows = movies[['movieId']].reset_index(drop=True).drop_duplicates('movieId', keep='first')
+        self.movie_index = pd.Index(first_rows['movieId'].to_numpy())
+        # the trailing -1 is what get_indexer's -1 (unknown movieId) picks
+        self.movie_positions = np.append(first_rows.index.to_numpy(), -1)
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def movie_id(self, title):
+        """Returns the movieId of a title, or None if it is not in the catalogue."""
+        position = self.title_index.get(title)
+        return None if position is None else self.movie_ids[position]
+
+    def positions(self, movie_ids):
+        """Row positions of the given movieIds (-1 for unknown ones)."""
+        return self.movie_positions[self.movie_index.get_indexer(np.asarray(movie_ids))]
+
+    def info(self, title):
+        """Returns the served columns of one title as a dict, or None if it is not in the catalogue."""
+        position = self.title_index.get(title)
+        if position is None:
+            return None
+        return {
+            'movieId': self.movie_ids[position],
+            'title': self.titles[position],
+            'year': self.years[position],
+            'avg_rating': self.avg_ratings[position],
+            'movie_id': self.tmdb_ids[position],
+        }
+
+    def hydrate(self, movie_ids):
+        """
+        Returns the served columns of many movies in the given order, unknown movieIds are skipped.
+
+        Args:
+            movie_ids: array of movieIds
+
+        Returns:
+            dict of arrays (movieId, title, year, avg_rating, movie_id)
+        """
+        positions = self.positions(movie_ids)
+        positions = positions[positions >= 0]
+        return {
+            'movieId': self.movie_ids[positions],
+            'title': self.titles[positions],
+            'year': self.years[positions],
+            'avg_rating': self.avg_ratings[positions],
+            'movie_id': self.tmdb_ids[positions],
+        }
@@ -0,0 +1,116 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Approximate bytes held per (query, item) pair while a block is scored:
+# sparse product (data + indices), dense similarities and dense distances
+BYTES_PER_PAIR = 32
+
+
+def top_k_smallest(values, k):
+    """The k smallest values of every row and their column indices, sorted ascending (ties by column)."""
+    k = min(k, values.shape[1])
+    if k < values.shape[1]:
+        candidates = np.argpartition(values, k - 1, axis=1)[:, :k]
+        candidates.sort(axis=1)
+    else:
+        candidates = np.broadcast_to(np.arange(values.shape[1]), values.shape)
+    candidate_values = np.take_along_axis(values, candidates, axis=1)
+    order = np.argsort(candidate_values, axis=1, kind='stable')
+    return np.take_along_axis(candidate_values, order, axis=1), np.take_along_axis(candidates, order, axis=1)
+
+
+def top_n(scores, n):
+    """Indices and values of the n largest scores of every row, largest first (ties by index)."""
+    negated, indices = top_k_smallest(-scores, n)
+    return indices, -negated
+
+# Create Class for the Blocked Cosine Similarity Engine
+class CosineSimilarityEngine:
+    def __init__(self, X, memory_limit_mb=512, n_jobs=None):
+        """
+        Exact cosine kNN over the item columns of X using blocked sparse products.
+
+        Item columns are L2-normalised once, so the cosine similarity of a block of
+        query items against every item is a single sparse product. Only one block of
+        n_queries x n_items similarities exists at a time, the full item-item matrix
+        is never materialised.
+
+        Args:
+            X: user-item utility matrix (users x items)
+            memory_limit_mb: ceiling for the memory used by the blocks of similarities in flight
+            n_jobs: number of threads scoring query blocks (-1 uses all cores, None uses one)
+        """
+        self.X = X
+        self.metric = 'cosine'
+        self.algorithm = 'brute'
+        self.memory_limit_mb = memory_limit_mb
+        self.n_jobs = os.cpu_count() if n_jobs is not None and n_jobs < 0 else (n_jobs or 1)
+        self.item_matrix = None
+        self.user_matrix = None
+
+    @property
+    def n_items(self):
+        return self.X.shape[1]
+
+    @property
+    def block_size(self):
+        """Number of query items scored per block, so that the blocks of all threads stay under the memory ceiling."""
+        return max(1, int(self.memory_limit_mb * 1024**2 // (self.n_items * BYTES_PER_PAIR * self.n_jobs)))
+
+    def fit(self):
+        """L2-normalises the item columns and keeps both item-user and user-item layouts."""
+        try:
+            self.item_matrix = normalize(csr_matrix(self.X.T, dtype=np.float64), norm='l2', axis=1)
+            self.user_matrix = self.item_matrix.T.tocsr()
+            logging.info(f'Cosine Similarity Engine Fitted: block size:{self.block_size}')
+            return self
+        except Exception as e:
+            logging.error(f'Error in Fitting Cosine Similarity Engine: {e}')
+            raise e
+
+    def kneighbors(self, item_indices, n_neighbors, return_distance=True):
+        """
+        Finds the nearest items for the given item indices.
+
+        Args:
+            item_indices: int or array of item (column) indices of X
+            n_neighbors: number of neighbours to return per item
+            return_distance: whether to return the cosine distances as well
+
+        Returns:
+            distances (if return_distance) and neighbour item indices, both of shape (n_queries, n_neighbors)
+        """
+        if self.item_matrix is None:
+            self.fit()
+        item_indices = np.atleast_1d(np.asarray(item_indices, dtype=np.int64))
+        n_neighbors = min(n_neighbors, self.n_items)
+        distances = np.empty((len(item_indices), n_neighbors), dtype=np.float64)
+        neighbours = np.empty((len(item_indices), n_neighbors), dtype=np.int64)
+
+        def score_block(start, stop):
+            similarities = (self.item_matrix[item_indices[start:stop]] @ self.user_matrix).toarray()
+            # cosine distance as computed by sklearn, clipped against rounding errors
+            np.subtract(1.0, similarities, out=similarities)
+            np.clip(similarities, 0.0, 2.0, out=similarities)
+            distances[start:stop], neighbours[start:stop] = top_k_smallest(similarities, n_neighbors)
+
+        # every thread gets at least one block; scipy's sparse products and the numpy selection release the GIL
+        block_size = max(1, min(self.block_size, -(-len(item_indices) // self.n_jobs)))
+        blocks = [(start, min(start + block_size, len(item_indices))) for start in range(0, len(item_indices), block_size)]
+        if self.n_jobs > 1 and len(blocks) > 1:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                list(executor.map(lambda block: score_block(*block), blocks))
+        else:
+            for start, stop in blocks:
+                score_block(start, stop)
+
+        if return_distance:
+            return distances, neighbours
+        return neighbours
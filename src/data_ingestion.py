@@ -1,54 +1,172 @@
 # Import Dependencies
+import hashlib
+import json
 import logging
 import os
 from zipfile import ZipFile
+import numpy as np
 import pandas as pd
 import gc
 
 # Setup logging Configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Columns and compact dtypes read from each CSV file ('timestamp' is never needed)
+CSV_SCHEMAS = {
+    'links.csv': {'movieId': np.int32, 'imdbId': np.int32, 'tmdbId': np.float32},
+    'movies.csv': {'movieId': np.int32, 'title': str, 'genres': str},
+    'ratings.csv': {'userId': np.int32, 'movieId': np.int32, 'rating': np.float32},
+}
+
 # Create Class for ZIP Ingestion
 class ZipDataIngestor():
+    def __init__(self, stream:bool=False, chunksize:int=1_000_000, cache_dir:str=None):
+        """
+        Args:
+            stream: read the CSV members straight out of the zip in chunks instead of extracting it
+            chunksize: number of rows parsed per chunk in stream mode
+            cache_dir: directory of a columnar .npy cache written after parsing and read by later runs
+        """
+        self.stream = stream
+        self.chunksize = chunksize
+        self.cache_dir = cache_dir
+
     def ingest(self, file_path:str) -> pd.DataFrame:
-        """Extracts a zip file and returns the content as a pandas DataFrame"""
+        """Extracts (or streams) a zip file and returns the content as pandas DataFrames"""
         try:
             # Ensure the file is a zip file
             if not file_path.endswith('.zip'):
                 raise ValueError("The provided file is not a zip file")
-            
-            # Extract zip file
-            with ZipFile(file_path, "r") as zip_ref:
-                zip_ref.extractall("extracted_data")
-            
-            # Find extracted CSV file
-            extracted_files = os.listdir(r"extracted_data\ml-latest")
-            csv_files = [f for f in extracted_files if f.endswith('.csv')]
-            
-            # Ensure the csv_files is not empty
-            if len(csv_files) == 0:
-                raise FileNotFoundError("No CSV file is found in the extracted data.")
-            
-            links_index = csv_files.index('links.csv')
-            movies_index = csv_files.index('movies.csv')
-            ratings_index = csv_files.index('ratings.csv')
-            
-            # Read the CSV files into DataFrame
-            csv_file1_path = os.path.join(r"extracted_data\ml-latest", csv_files[links_index])
-            csv_file2_path = os.path.join(r"extracted_data\ml-latest", csv_files[movies_index])
-            csv_file3_path = os.path.join(r"extracted_data\ml-latest", csv_files[ratings_index])
-            
-            links = pd.read_csv(csv_file1_path)
-            movies = pd.read_csv(csv_file2_path)
-            ratings = pd.read_csv(csv_file3_path)
-            
-            del extracted_files, csv_files, csv_file1_path, csv_file2_path, csv_file3_path, 
-            links_index, movies_index, ratings_index
-            gc.collect()
-            
+
+            cache_path = self._cache_path(file_path)
+            if cache_path is not None and os.path.exists(os.path.join(cache_path, 'manifest.json')):
+                links, movies, ratings = (self._load_frame(cache_path, name) for name in ('links', 'movies', 'ratings'))
+                logging.info(f"Data Ingestion Completed Successfully (from cache {cache_path})")
+                return links, movies, ratings
+
+            if self.stream:
+                links, movies, ratings = self._read_zip(file_path)
+            else:
+                links, movies, ratings = self._extract_zip(file_path)
+
+            if cache_path is not None:
+                self._save_cache(cache_path, links=links, movies=movies, ratings=ratings)
+
             logging.info("Data Ingestion Completed Successfully")
             # Return the dataframes
             return links, movies, ratings
         except Exception as e:
             logging.error(f"Error in Data Ingestion: {e}")
             raise e
+
+    def _extract_zip(self, file_path):
+        """Extracts the whole zip to disk and reads the CSV files"""
+        # Extract zip file
+        with ZipFile(file_path, "r") as zip_ref:
+            zip_ref.extractall("extracted_data")
+
+        # Find extracted CSV files (ml-latest/ or any other folder inside the zip)
+        csv_paths = {}
+        for root, _, files in os.walk("extracted_data"):
+            for f in files:
+                if f.endswith('.csv'):
+                    csv_paths.setdefault(f, os.path.join(root, f))
+
+        # Ensure the csv_files is not empty
+        if len(csv_paths) == 0:
+            raise FileNotFoundError("No CSV file is found in the extracted data.")
+
+        # Read the CSV files into DataFrame
+        links = pd.read_csv(csv_paths['links.csv'])
+        movies = pd.read_csv(csv_paths['movies.csv'])
+        ratings = pd.read_csv(csv_paths['ratings.csv'])
+
+        del csv_paths
+        gc.collect()
+        return links, movies, ratings
+
+    def _read_zip(self, file_path):
+        """Streams the CSV members out of the zip in chunks with compact dtypes"""
+        frames = tuple(self.read_member(file_path, csv_name) for csv_name in ('links.csv', 'movies.csv', 'ratings.csv'))
+        gc.collect()
+        return frames
+
+    def read_member(self, file_path, csv_name):
+        """Streams one CSV member (links.csv, movies.csv or ratings.csv) out of the zip with compact dtypes"""
+        with ZipFile(file_path, "r") as zip_ref:
+            members = {os.path.basename(name): name for name in zip_ref.namelist() if name.endswith('.csv')}
+
+            # Ensure the csv file is in the zip
+            if csv_name not in members:
+                raise FileNotFoundError(f"No {csv_name} is found in the zip file.")
+
+            # every row ends one line after the header, so the line count bounds the number of rows
+            with zip_ref.open(members[csv_name]) as f:
+                n_rows = sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 24), b''))
+
+            # numeric columns are filled chunk by chunk, so only one chunk exists besides the final arrays;
+            # text columns (movies.csv only) are joined once at the end
+            schema = CSV_SCHEMAS[csv_name]
+            columns = {name: [] if dtype is str else np.empty(n_rows, dtype=dtype) for name, dtype in schema.items()}
+            n_filled = 0
+            with zip_ref.open(members[csv_name]) as f:
+                for chunk in pd.read_csv(f, usecols=list(schema), dtype=schema, chunksize=self.chunksize):
+                    for name, column in columns.items():
+                        if isinstance(column, list):
+                            column.append(chunk[name])
+                        else:
+                            column[n_filled:n_filled + len(chunk)] = chunk[name].to_numpy()
+                    n_filled += len(chunk)
+                    del chunk
+
+        frame = pd.DataFrame({
+            name: (pd.concat(column, ignore_index=True) if column else pd.Series([], dtype=str))
+            if isinstance(column, list) else column[:n_filled]
+            for name, column in columns.items()
+        }, copy=False)
+        logging.info(f"Streamed {csv_name}: {len(frame):,} rows")
+        return frame
+
+    def _cache_path(self, file_path):
+        """Cache directory of this zip, keyed by its name, size, modification time and the way it is parsed"""
+        if self.cache_dir is None:
+            return None
+        stat = os.stat(file_path)
+        name = os.path.splitext(os.path.basename(file_path))[0]
+        # extract mode keeps every column with inferred dtypes, stream mode only the CSV_SCHEMAS columns and dtypes
+        if self.stream:
+            schema = {csv_name: {column: 'str' if dtype is str else np.dtype(dtype).str for column, dtype in columns.items()}
+                      for csv_name, columns in CSV_SCHEMAS.items()}
+            mode = f"stream-{hashlib.sha1(json.dumps(schema, sort_keys=True).encode()).hexdigest()[:12]}"
+        else:
+            mode = 'extract'
+        return os.path.join(self.cache_dir, f"{name}-{stat.st_size}-{int(stat.st_mtime)}-{mode}")
+
+    def _save_cache(self, cache_path, **frames):
+        """Writes every column of every frame as a .npy file"""
+        os.makedirs(cache_path, exist_ok=True)
+        manifest = {}
+        for name, df in frames.items():
+            manifest[name] = []
+            for column in df.columns:
+                values = df[column]
+                if pd.api.types.is_numeric_dtype(values):
+                    kind, array = 'numeric', values.to_numpy()
+                else:
+                    kind, array = 'str', values.astype(str).to_numpy(dtype=str)
+                np.save(os.path.join(cache_path, f"{name}_{column}.npy"), array)
+                manifest[name].append({'name': column, 'kind': kind})
+        # the manifest is written last, so an interrupted write is never read back
+        with open(os.path.join(cache_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f)
+        logging.info(f"Saved columnar ingestion cache to {cache_path}")
+
+    def _load_frame(self, cache_path, name):
+        """Reads one frame back from the .npy cache"""
+        with open(os.path.join(cache_path, 'manifest.json')) as f:
+            columns = json.load(f)[name]
+        frame = {}
+        for column in columns:
+            values = np.load(os.path.join(cache_path, f"{name}_{column['name']}.npy"))
+            frame[column['name']] = values.astype(object) if column['kind'] == 'str' else values
+        return pd.DataFrame(frame)
@@ -1,11 +1,12 @@
 import logging
-import os
 import pandas as pd
 import numpy as np
-import pickle
 from typing import Tuple
 from scipy.sparse import csr_matrix
 import gc
+from src.id_mapper import IdMapper
+from src.artifact_store import ArtifactStore
+from src.instrumentation import log_step
 
 
 # Setup logging Configuration
@@ -13,138 +14,157 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 
 # Create Class for Data Preprocessing
 class DataPreprocessing():
-    def clean(self, movies:pd.DataFrame, ratings:pd.DataFrame, links:pd.DataFrame) -> Tuple[
-        pd.DataFrame, csr_matrix, dict, dict]:
+    @staticmethod
+    def create_X(df:pd.DataFrame) -> Tuple[csr_matrix, IdMapper, IdMapper]:
+        """
+        Generates a sparse matrix from ratings dataframe.
+        
+        Args:
+            df: pandas dataframe containing 3 columns (userId, movieId, rating)
+        
+        Returns:
+            X: sparse matrix
+            user_mapper: IdMapper that maps user id's to user indices
+            movie_mapper: IdMapper that maps movie id's to movie indices
+        """
+        # sorted factorize gives the same indices as np.unique, without per-row dict lookups
+        user_index, user_ids = pd.factorize(df['userId'], sort=True)
+        item_index, movie_ids = pd.factorize(df['movieId'], sort=True)
+        M, N = len(user_ids), len(movie_ids)
+        
+        X = csr_matrix(
+            (df['rating'].to_numpy(dtype=np.float32),
+             (user_index.astype(np.int32), item_index.astype(np.int32))),
+            shape=(M,N)
+        )
+        
+        return X, IdMapper(np.asarray(user_ids)), IdMapper(np.asarray(movie_ids))
+
+    def clean(self, movies:pd.DataFrame, ratings:pd.DataFrame, links:pd.DataFrame, store:ArtifactStore=None,
+              make_current:bool=True) -> Tuple[
+        pd.DataFrame, csr_matrix, IdMapper, IdMapper]:
         """Cleans and Format the data and saves the artifacts for model training.
         
         Args:
             movies: pandas dataframe containing movies data
             ratings: pandas dataframe containing ratings data
             links: pandas dataframe containing links data
+            store: ArtifactStore the artifacts are saved into (artifacts/store by default)
+            make_current: whether the saved version becomes the served one (its name is kept in self.version)
         
         Returns:
             cleaned_data: pandas dataframe containing cleaned movies and ratings data
             X: sparse matrix
-            movie_mapper: dict that maps movie id's to movie indices
-            movie_inv_mapper: dict that maps movie indices to movie id's
+            movie_mapper: IdMapper that maps movie id's to movie indices
+            movie_inv_mapper: IdMapper that maps movie indices to movie id's
         """
         try:
-            # Step 1: Merge both dataframes on movieId
-            movie_ratings = ratings.merge(movies, on='movieId')
-            logging.info("Merged 'movies' and 'ratings' DataFrames Completed Successfully")
-            
-            del ratings
-            gc.collect()
-            
-            # Step 2: Drop Duplicate Rows
-            movie_ratings.drop_duplicates(inplace=True)
-            movie_ratings.drop_duplicates(subset=['userId','title'], inplace=True)
+            # Step 1: Encode movies by integer codes instead of merging them into every rating
+            with log_step('Step 1: Encode movies'):
+                movies = movies.drop_duplicates(subset=['movieId']).reset_index(drop=True)
+                title_codes, titles = pd.factorize(movies['title'])
+                n_titles = len(titles)
+                # ratings of movies with a missing title or genres are dropped, as dropna did after the merge
+                valid_movie = (title_codes >= 0) & movies['genres'].notna().to_numpy()
+                
+                # position of every rating's movie in the movies frame (-1 if the movie is unknown)
+                movie_order = np.argsort(movies['movieId'].to_numpy(), kind='stable')
+                sorted_movie_ids = movies['movieId'].to_numpy()[movie_order]
+                rating_movie_ids = ratings['movieId'].to_numpy()
+                positions = np.minimum(np.searchsorted(sorted_movie_ids, rating_movie_ids), len(sorted_movie_ids) - 1)
+                movie_pos = np.where(sorted_movie_ids[positions] == rating_movie_ids, movie_order[positions], -1)
+                rating_title = np.where(movie_pos >= 0, title_codes[movie_pos], -1)
+                del movie_order, sorted_movie_ids, rating_movie_ids, positions
+            logging.info("Encoded 'movies' and 'ratings' by Integer Codes Completed Successfully")
+            
+            # Step 2: Drop Duplicate Rows (one rating per user and title, first one kept)
+            with log_step('Step 2: Drop duplicates') as record:
+                user_ids = ratings['userId'].to_numpy()
+                keys = user_ids.astype(np.int64) * (n_titles + 1) + (rating_title + 1)
+                keep = (movie_pos >= 0) & ~pd.Series(keys).duplicated(keep='first').to_numpy()
+                record.update(rows_in=len(keep), rows=int(keep.sum()))
+                del keys
+                gc.collect()
             logging.info("Dropped Duplicate Rows Completed Successfully")
             
             # Step 3: Drop Missing Values
-            movie_ratings.dropna(inplace=True)
+            with log_step('Step 3: Drop missing values'):
+                rating_values = ratings['rating'].to_numpy()
+                keep &= ~np.isnan(rating_values) & ~pd.isna(user_ids)
+                keep[keep] = valid_movie[movie_pos[keep]]
             logging.info("Dropped Missing Values Completed Successfully")
             
             # Step 4: Drop Unnecessary Columns
-            movie_ratings.drop(columns=['genres','timestamp'], inplace=True)
-            movies.drop(columns=['genres'], inplace=True)
+            with log_step('Step 4: Drop columns'):
+                movies = movies.drop(columns=['genres'])
             logging.info("Dropped Unnecessary Columns Completed Successfully")
             
             # Step 5: Add year column
-            movies['year'] = movies['title'].str.extract(r'\((\d{4})\)')[0]
+            with log_step('Step 5: Add year column'):
+                movies['year'] = movies['title'].str.extract(r'\((\d{4})\)')[0]
             logging.info("Added Year Column Completed Successfully")
             
-            # Step 6: Add Average Rating column
-            average_ratings = movie_ratings.groupby('title')['rating'].mean().reset_index()
-            average_ratings.rename(columns={'rating':'avg_rating'}, inplace=True)
-            movies = movies.merge(average_ratings, on='title')
+            # Step 6: Per-title rating count and average in one pass over the title codes
+            with log_step('Step 6: Count and average ratings'):
+                kept_titles = rating_title[keep]
+                num_of_rating = np.bincount(kept_titles, minlength=n_titles)
+                rating_sum = np.bincount(kept_titles, weights=rating_values[keep], minlength=n_titles)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    avg_rating = rating_sum / num_of_rating
+                del kept_titles, rating_sum
             logging.info("Added Average Rating Column Completed Successfully")
             
             # Step 7:Take those movies which got at least 50 rating of user
-            number_rating = movie_ratings.groupby('title')['rating'].count().reset_index()
-            number_rating.rename(columns={'rating':'num_of_rating'},inplace=True)
-            
-            # Filter movies dataframe
-            movies = movies.merge(number_rating, on='title')
-            movies = movies[movies['num_of_rating'] >= 50]
-            movies.drop(columns=['num_of_rating'], inplace=True)
-            
-            # Filter movie_ratings dataframe
-            final_ratings = movie_ratings.merge(number_rating, on='title')
-            final_ratings = final_ratings[final_ratings['num_of_rating'] >= 50]
-            final_ratings.drop(columns=['num_of_rating'], inplace=True)
+            with log_step('Step 7: Filter movies') as record:
+                popular_title = num_of_rating >= 50
+                movie_title_codes = np.where(title_codes >= 0, title_codes, 0)
+                
+                # Filter movies dataframe
+                popular_movie = (title_codes >= 0) & popular_title[movie_title_codes]
+                movies['avg_rating'] = avg_rating[movie_title_codes]
+                movies['num_of_rating'] = num_of_rating[movie_title_codes]
+                movies = movies[popular_movie].reset_index(drop=True)
+                
+                # Filter ratings before building any wide frame
+                keep[keep] = popular_title[rating_title[keep]]
+                final_ratings = pd.DataFrame({
+                    'userId': user_ids[keep],
+                    'movieId': ratings['movieId'].to_numpy()[keep],
+                    'rating': rating_values[keep],
+                    'title': pd.Categorical.from_codes(rating_title[keep], categories=titles),
+                })
+                record.update(movies=len(movies), rows=len(final_ratings))
             logging.info("Filtered Movies with at least 50 Ratings Completed Successfully")
             
-            del number_rating, movie_ratings, average_ratings
+            del ratings, movie_pos, rating_title, keep, user_ids, rating_values
             gc.collect()
             # Step 8: Add TMDB movie_id (from links.csv)
-            movies = movies.merge(links[['movieId', 'tmdbId']], on='movieId', how='left')
-            movies.rename(columns={'tmdbId': 'movie_id'}, inplace=True)
+            with log_step('Step 8: Add TMDB movie_id'):
+                movies = movies.merge(links[['movieId', 'tmdbId']], on='movieId', how='left')
+                movies.rename(columns={'tmdbId': 'movie_id'}, inplace=True)
             logging.info("Merged 'links' DataFrame to add TMDB movie_id Completed Successfully")
             
             # Step 9: Transform our dataframe into a user-item matrix, also known as a "utility" matrix.
             # We will use a crs matrix from scipy for this transformation.
-            def create_X(df):
-                """
-                Generates a sparse matrix from ratings dataframe.
-                
-                Args:
-                    df: pandas dataframe containing 3 columns (userId, movieId, rating)
-                
-                Returns:
-                    X: sparse matrix
-                    movie_mapper: dict that maps movie id's to movie indices
-                    movie_inv_mapper: dict that maps movie indices to movie id's
-                """
-                M = df['userId'].nunique()
-                N = df['movieId'].nunique()
-                
-                user_mapper = dict(zip(np.unique(df["userId"]), list(range(M))))
-                movie_mapper = dict(zip(np.unique(df["movieId"]), list(range(N))))
-                
-                movie_inv_mapper = dict(zip(list(range(N)), np.unique(df["movieId"])))
-                
-                user_index = [user_mapper[i] for i in df['userId']]
-                item_index = [movie_mapper[i] for i in df['movieId']]
-                
-                X = csr_matrix((df["rating"], (user_index,item_index)), shape=(M,N))
-                
-                return X, movie_mapper, movie_inv_mapper
-            
-            X, movie_mapper,  movie_inv_mapper = create_X(final_ratings)
+            with log_step('Step 9: Create user-item matrix') as record:
+                X, user_mapper, movie_mapper = self.create_X(final_ratings)
+                record['nnz'] = int(X.nnz)
+                movie_inv_mapper = movie_mapper.inverse
             logging.info("Created User-Item Matrix Completed Successfully")
             
             # Step 10: Evaluate sparsity of the matrix
-            n_total = X.shape[0]*X.shape[1]
-            n_ratings = X.nnz
-            sparsity = n_ratings/n_total
+            with log_step('Step 10: Evaluate sparsity') as record:
+                n_total = X.shape[0]*X.shape[1]
+                n_ratings = X.nnz
+                sparsity = n_ratings/n_total
+                record.update(users=X.shape[0], items=X.shape[1], nnz=int(n_ratings))
             logging.info(f'Sparsity of the User-Item Matrix: {round(sparsity*100,2)}')
             
             # Final Step: Save The Artifacts
             logging.info("Saving artifacts...")
-            
-            # Create artifacts directory if it doesn't exist
-            os.makedirs('artifacts', exist_ok=True)
-            logging.info("Artifacts directory created/verified")
-            
-            # Save movies dataframe
-            movies.to_pickle('artifacts/movies_processed.pkl')
-            logging.info("Saved: movies_processed.pkl")
-            
-            # Save X matrix
-            with open('artifacts/X_matrix.pkl', 'wb') as f:
-                pickle.dump(X, f)
-            logging.info("Saved: X_matrix.pkl")
-            
-            # Save movie_mapper
-            with open('artifacts/movie_mapper.pkl', 'wb') as f:
-                pickle.dump(movie_mapper, f)
-            logging.info("Saved: movie_mapper.pkl")
-            
-            # Save movie_inv_mapper
-            with open('artifacts/movie_inv_mapper.pkl', 'wb') as f:
-                pickle.dump(movie_inv_mapper, f)
-            logging.info("Saved: movie_inv_mapper.pkl")
+            store = ArtifactStore() if store is None else store
+            with log_step('Save artifacts'):
+                self.version = store.save(X, movie_mapper, user_mapper, movies, make_current=make_current)
             
             del links, movies
             gc.collect()
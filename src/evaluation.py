@@ -0,0 +1,370 @@
+import argparse
+import json
+import logging
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from src.als import ALSModel
+from src.artifact_store import ArtifactStore, DEFAULT_STORE_DIR
+from src.cosine_engine import top_n
+from src.data_ingestion import ZipDataIngestor
+from src.id_mapper import IdMapper
+from src.instrumentation import RunReport, peak_rss_mb
+from src.personalized import PersonalizedRecommender
+from src.similarity_index import build_similarity_index
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_REPORT_DIR = os.path.join('artifacts', 'evaluation')
+
+# Ways of holding out the test ratings, see Evaluator.split
+SPLITS = ('leave_one_out', 'time', 'random')
+
+
+# Create Class for Item-kNN Recommendations of a User
+class ItemKNNRecommender:
+    def __init__(self, metric='cosine', algorithm='brute', n_neighbors=50):
+        """
+        Turns an item similarity index (one app style) into user recommendations.
+
+        Every movie the user rated at or above their mean votes for its n_neighbors
+        nearest items with weight rating / (1 + rank). Ranks instead of distances keep
+        cosine and manhattan comparable.
+
+        Args:
+            metric: distance metric of the index
+            algorithm: kNN algorithm of the index ('brute', 'auto', 'ann', 'als', ...)
+            n_neighbors: neighbours taken per rated movie
+        """
+        self.metric = metric
+        self.algorithm = algorithm
+        self.n_neighbors = n_neighbors
+        self.index = None
+
+    def fit(self, X):
+        self.X = X
+        self.index = build_similarity_index(X, metric=self.metric, algorithm=self.algorithm)
+        return self
+
+    def recommend(self, rows, n):
+        history = self.X[rows]
+        top = np.empty((len(rows), n), dtype=np.int64)
+        for position in range(len(rows)):
+            items = history.indices[history.indptr[position]:history.indptr[position + 1]]
+            ratings = history.data[history.indptr[position]:history.indptr[position + 1]]
+            liked = ratings >= ratings.mean()
+            neighbours = self.index.kneighbors(items[liked], self.n_neighbors + 1, return_distance=False)[:, 1:]
+            weights = ratings[liked, None] / (1.0 + np.arange(neighbours.shape[1]))
+            scores = np.bincount(neighbours.ravel(), weights=np.broadcast_to(weights, neighbours.shape).ravel(),
+                                 minlength=self.X.shape[1])
+            scores[items] = -np.inf
+            top[position] = top_n(scores[None, :], n)[0][0]
+        return top
+
+
+# Create Class for Personalised Recommendations under Evaluation
+class PersonalizedEvalRecommender:
+    def __init__(self):
+        """User-based scoring of PersonalizedRecommender (Xn^T Xn r) over the training matrix."""
+        self.model = None
+
+    def fit(self, X):
+        identity = IdMapper(np.arange(X.shape[1]))
+        self.model = PersonalizedRecommender(X, identity, identity, IdMapper(np.arange(X.shape[0]))).fit()
+        return self
+
+    def recommend(self, rows, n):
+        return self.model.recommend_batch(rows, n=n)[0]
+
+
+# Create Class for ALS Recommendations under Evaluation
+class ALSEvalRecommender:
+    def __init__(self, **params):
+        """Per-user predicted-rating ranking of ALSModel (params are passed to ALSModel)."""
+        self.params = params
+        self.model = None
+
+    def fit(self, X):
+        self.model = ALSModel(X, **self.params).fit()
+        return self
+
+    def recommend(self, rows, n):
+        return self.model.recommend(rows, n=n)[0]
+
+
+# Models the harness knows by name: the app's kNN styles and the user-level models
+MODELS = {
+    'cosine/brute': lambda: ItemKNNRecommender('cosine', 'brute'),
+    'manhattan/auto': lambda: ItemKNNRecommender('manhattan', 'auto'),
+    'cosine/ann': lambda: ItemKNNRecommender('cosine', 'ann'),
+    'cosine/als': lambda: ItemKNNRecommender('cosine', 'als'),
+    'personalized': lambda: PersonalizedEvalRecommender(),
+    'als': lambda: ALSEvalRecommender(),
+}
+
+# State of a worker process: (fitted model, held-out relevant items per test user, k)
+_WORKER = None
+
+
+def _init_worker(model, relevant, k):
+    global _WORKER
+    _WORKER = (model, relevant, k)
+
+
+def _evaluate_users(rows):
+    """Scores a chunk of test users: per-user metrics, recommended items, query latencies and the process's peak RSS."""
+    model, relevant, k = _WORKER
+    precision, recall, ndcg, latencies = [], [], [], []
+    recommended = []
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    for row in rows:
+        start = time.perf_counter()
+        items = model.recommend(np.array([row]), k)[0]
+        latencies.append(time.perf_counter() - start)
+        hits = np.isin(items, relevant[row])
+        n_relevant = len(relevant[row])
+        precision.append(hits.sum() / k)
+        recall.append(hits.sum() / n_relevant)
+        ndcg.append((hits * discounts[:len(hits)]).sum() / discounts[:min(n_relevant, k)].sum())
+        recommended.append(items)
+    covered = np.unique(np.concatenate(recommended)) if recommended else np.array([], dtype=np.int64)
+    return precision, recall, ndcg, latencies, covered, peak_rss_mb()
+
+
+# Create Class for the Offline Evaluation Harness
+class Evaluator:
+    def __init__(self, k=10, split='leave_one_out', test_fraction=0.2, n_users=2000, min_ratings=5,
+                 relevant_rating=4.0, n_jobs=-1, chunk_size=100, random_state=0):
+        """
+        Offline evaluation of ranking quality and cost of the recommendation models.
+
+        Ratings of sampled users are held out; every model is fitted on the remaining
+        matrix and asked for k recommendations per test user. Held-out movies rated at
+        least relevant_rating are the relevant ones.
+
+        Args:
+            k: length of the recommendation lists
+            split: 'leave_one_out' (one relevant rating per test user), 'time' (the latest
+                test_fraction of a test user's ratings, needs timestamps) or 'random' (a random test_fraction)
+            test_fraction: share of a test user's ratings that is held out by the 'time' and 'random' splits
+            n_users: number of sampled test users
+            min_ratings: minimum number of ratings of a test user
+            relevant_rating: minimum held-out rating that counts as relevant
+            n_jobs: number of worker processes scoring the test users (-1 uses all cores)
+            chunk_size: test users per worker task
+            random_state: seed of the user sample and the split
+        """
+        if split not in SPLITS:
+            raise ValueError(f"Unknown split: {split} (expected one of {', '.join(SPLITS)})")
+        self.k = k
+        self.split_mode = split
+        self.test_fraction = test_fraction
+        self.n_users = n_users
+        self.min_ratings = min_ratings
+        self.relevant_rating = relevant_rating
+        self.n_jobs = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+        self.chunk_size = chunk_size
+        self.random_state = random_state
+
+    def split(self, X, timestamps=None):
+        """
+        Holds out ratings of up to n_users random users, as chosen by the split mode.
+
+        Args:
+            X: user-item utility matrix
+            timestamps: rating times aligned with the entries of X in CSR order (required by the 'time' split)
+
+        Returns:
+            X_train: X without the held-out ratings
+            relevant: dict mapping each test user row to its relevant held-out item indices
+        """
+        X = csr_matrix(X)
+        X.sort_indices()
+        rng = np.random.default_rng(self.random_state)
+        counts = np.diff(X.indptr)
+        rows = np.repeat(np.arange(X.shape[0]), counts)
+        is_relevant = X.data >= self.relevant_rating
+        candidates = counts >= self.min_ratings
+
+        # ratings are ranked within their row and the first n_held of every test user are held out
+        tie_break = rng.random(X.nnz)
+        if self.split_mode == 'time':
+            if timestamps is None or len(timestamps) != X.nnz:
+                raise ValueError("The 'time' split needs one timestamp per rating of X")
+            order = np.lexsort((tie_break, -np.asarray(timestamps, dtype=np.float64), rows))
+        elif self.split_mode == 'leave_one_out':
+            # only users with a relevant rating can be evaluated, one of those is held out
+            candidates &= np.bincount(rows[is_relevant], minlength=X.shape[0]) > 0
+            order = np.lexsort((tie_break, ~is_relevant, rows))
+        else:
+            order = np.lexsort((tie_break, rows))
+        candidates = np.flatnonzero(candidates)
+        users = rng.choice(candidates, min(self.n_users, len(candidates)), replace=False)
+
+        positions = np.empty(X.nnz, dtype=np.int64)
+        positions[order] = np.arange(X.nnz) - X.indptr[rows[order]]
+        n_held = np.zeros(X.shape[0], dtype=np.int64)
+        if self.split_mode == 'leave_one_out':
+            n_held[users] = 1
+        else:
+            n_held[users] = np.maximum(1, np.round(counts[users] * self.test_fraction)).astype(np.int64)
+        held = positions < n_held[rows]
+
+        X_train = csr_matrix((X.data[~held], X.indices[~held], np.concatenate(([0], np.cumsum(counts - n_held)))),
+                             shape=X.shape)
+        relevant_mask = held & is_relevant
+        relevant_rows, relevant_items = rows[relevant_mask], X.indices[relevant_mask]
+        relevant = {row: relevant_items[relevant_rows == row] for row in np.unique(relevant_rows)}
+        logging.info(f'Evaluation split ({self.split_mode}): {held.sum():,} held-out ratings, {len(relevant):,} test users with relevant items')
+        return X_train, relevant
+
+    def evaluate_model(self, name, model, X_train, relevant):
+        """Fits one model and measures its quality, fit cost, query latency and the memory of both phases."""
+        try:
+            # RSS is sampled per phase, so a model is not charged with the peak of the ones evaluated before it
+            phases = RunReport(name)
+            with phases.stage('fit') as fit_record:
+                tracemalloc.start()
+                start = time.perf_counter()
+                model.fit(X_train)
+                fit_time = time.perf_counter() - start
+                _, fit_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            rows = np.array(sorted(relevant))
+            chunks = [rows[start:start + self.chunk_size] for start in range(0, len(rows), self.chunk_size)]
+            with phases.stage('query') as query_record:
+                pooled = self.n_jobs > 1 and len(chunks) > 1
+                if pooled:
+                    # fresh workers per model, so their peak RSS belongs to this model only
+                    with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_worker,
+                                             initargs=(model, relevant, self.k)) as executor:
+                        results = list(executor.map(_evaluate_users, chunks))
+                else:
+                    _init_worker(model, relevant, self.k)
+                    results = [_evaluate_users(chunk) for chunk in chunks]
+
+            precision, recall, ndcg, latencies = (np.concatenate([result[i] for result in results]) for i in range(4))
+            covered = np.unique(np.concatenate([result[4] for result in results]))
+            # peak RSS of a scoring worker, or of this process when the users are scored here
+            worker_peaks = [result[5] for result in results if result[5] is not None]
+            query_peak = max(worker_peaks) if pooled and worker_peaks else query_record['peak_rss_mb']
+            report = {
+                f'precision@{self.k}': float(precision.mean()),
+                f'recall@{self.k}': float(recall.mean()),
+                f'ndcg@{self.k}': float(ndcg.mean()),
+                'coverage': len(covered) / X_train.shape[1],
+                'fit_time_s': fit_time,
+                'fit_peak_mb': fit_peak / 1024**2,
+                'fit_peak_rss_mb': fit_record['peak_rss_mb'],
+                'fit_rss_delta_mb': fit_record['rss_delta_mb'],
+                'query_peak_rss_mb': query_peak,
+                'latency_p50_ms': float(np.percentile(latencies, 50) * 1000),
+                'latency_p99_ms': float(np.percentile(latencies, 99) * 1000),
+                'users': len(rows),
+            }
+            logging.info(f'Evaluated {name}: ' + ', '.join(f'{key}={value:.4g}' for key, value in report.items()
+                                                             if isinstance(value, float)))
+            return report
+        except Exception as e:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            logging.error(f'Error in Evaluating {name}: {e}')
+            raise e
+
+    def run(self, X, models=None, timestamps=None):
+        """
+        Evaluates every model on one split of X.
+
+        Args:
+            X: user-item utility matrix from DataPreprocessing / the artifact store
+            models: dict mapping name to an unfitted recommender, or list of names from MODELS
+            timestamps: rating times aligned with the entries of X (see rating_timestamps), for the 'time' split
+
+        Returns:
+            report: JSON-serialisable dict with the configuration and the results per model
+        """
+        models = list(MODELS) if models is None else models
+        if not isinstance(models, dict):
+            models = {name: MODELS[name]() for name in models}
+        X_train, relevant = self.split(X, timestamps)
+        results = {name: self.evaluate_model(name, model, X_train, relevant) for name, model in models.items()}
+        return {
+            'created': datetime.now(timezone.utc).isoformat(),
+            'config': {'k': self.k, 'split': self.split_mode, 'test_fraction': self.test_fraction, 'n_users': self.n_users,
+                       'min_ratings': self.min_ratings, 'relevant_rating': self.relevant_rating,
+                       'random_state': self.random_state, 'n_jobs': self.n_jobs},
+            'data': {'users': X.shape[0], 'items': X.shape[1], 'ratings': int(X.nnz)},
+            'results': results,
+        }
+
+
+def rating_timestamps(ratings, X, user_mapper, movie_mapper):
+    """
+    Times of the ratings of X, aligned with its entries in CSR order.
+
+    Args:
+        ratings: pandas dataframe with userId, movieId and timestamp (as read by the extract mode of ZipDataIngestor)
+        X: user-item utility matrix built from these ratings
+        user_mapper: IdMapper of the rows of X
+        movie_mapper: IdMapper of the columns of X
+
+    Returns:
+        timestamps: float64 array with one time per entry of X (NaN for ratings without one)
+    """
+    X = csr_matrix(X)
+    X.sort_indices()
+    known = np.isin(ratings['userId'].to_numpy(), user_mapper.ids) & np.isin(ratings['movieId'].to_numpy(), movie_mapper.ids)
+    ratings = ratings[known]
+    # cleaning keeps the first rating of a (user, movie) pair
+    keys = user_mapper.to_index(ratings['userId']).astype(np.int64) * X.shape[1] + movie_mapper.to_index(ratings['movieId'])
+    times = pd.Series(ratings['timestamp'].to_numpy(dtype=np.float64), index=keys)
+    times = times[~times.index.duplicated(keep='first')]
+    rows = np.repeat(np.arange(X.shape[0], dtype=np.int64), np.diff(X.indptr))
+    return times.reindex(rows * X.shape[1] + X.indices).to_numpy()
+
+
+def save_report(report, path=None):
+    """Writes the report as JSON (to artifacts/evaluation/report-<timestamp>.json by default)."""
+    if path is None:
+        path = os.path.join(DEFAULT_REPORT_DIR, f"report-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f'Saved evaluation report: {path}')
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate ranking quality and cost of the recommendation models")
+    parser.add_argument('--store-dir', default=DEFAULT_STORE_DIR, help="artifact store directory")
+    parser.add_argument('--models', nargs='+', default=list(MODELS), choices=list(MODELS))
+    parser.add_argument('--k', type=int, default=10, help="length of the recommendation lists")
+    parser.add_argument('--n-users', type=int, default=2000, help="number of test users")
+    parser.add_argument('--split', default='leave_one_out', choices=SPLITS, help="how the test ratings are held out")
+    parser.add_argument('--test-fraction', type=float, default=0.2, help="share of a test user's ratings held out (time/random)")
+    parser.add_argument('--ratings-zip', default=None, help="MovieLens zip whose timestamps are used by the time split")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="worker processes (-1 uses all cores)")
+    parser.add_argument('--output', default=None, help="report path (JSON)")
+    args = parser.parse_args()
+
+    artifacts = ArtifactStore(args.store_dir).load()
+    timestamps = None
+    if args.split == 'time':
+        if args.ratings_zip is None:
+            parser.error("--split time needs --ratings-zip (the artifacts keep no timestamps)")
+        # the extract mode keeps the timestamp column
+        _, _, ratings = ZipDataIngestor().ingest(args.ratings_zip)
+        timestamps = rating_timestamps(ratings, artifacts.X, artifacts.user_mapper, artifacts.movie_mapper)
+    evaluator = Evaluator(k=args.k, split=args.split, test_fraction=args.test_fraction, n_users=args.n_users,
+                          n_jobs=args.n_jobs)
+    report = evaluator.run(artifacts.X, args.models, timestamps)
+    report['artifact_version'] = artifacts.version
+    save_report(report, args.output)
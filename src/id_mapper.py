@@ -0,0 +1,96 @@
+import numpy as np
+
+# Create Class for the Array-Backed Id Mapper
+class IdMapper:
+    def __init__(self, ids, inverse=False):
+        """
+        Maps between raw id's and matrix indices using a sorted NumPy id array.
+
+        The forward mapper behaves like the old {id: index} dict, the inverse one
+        like the old {index: id} dict. Both offer vectorized to_index/to_ids.
+
+        Args:
+            ids: sorted array of unique id's, position i holds the id of index i
+            inverse: whether dict-like lookups map indices to id's
+        """
+        self.ids = np.asarray(ids)
+        self.is_inverse = inverse
+
+    @classmethod
+    def from_dict(cls, mapping, inverse=False):
+        """Builds a mapper from a legacy {id: index} dict, or from an {index: id} dict when inverse."""
+        keys = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+        values = np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))
+        ids = np.empty(len(mapping), dtype=np.int64)
+        if inverse:
+            ids[keys] = values
+        else:
+            ids[values] = keys
+        return cls(ids, inverse=inverse)
+
+    @property
+    def inverse(self):
+        """Mapper view whose dict-like lookups go the other way."""
+        return IdMapper(self.ids, inverse=not self.is_inverse)
+
+    def to_index(self, ids):
+        """Maps an array of id's to indices, raises KeyError for unknown id's."""
+        ids = np.asarray(ids)
+        if ids.size == 0:
+            return np.empty(ids.shape, dtype=np.int32)
+        # id's are never cast to the mapper's dtype directly, that would wrap or truncate them onto other id's
+        if ids.dtype.kind == 'f':
+            integral = np.isfinite(ids) & (np.floor(ids) == ids)
+            if not integral.all():
+                raise KeyError(f'Unknown id(s): {ids[~integral].tolist()}')
+        elif ids.dtype.kind not in 'iu':
+            raise KeyError(f'Unknown id(s): {ids.ravel().tolist()}')
+        if len(self.ids) == 0:
+            raise KeyError(f'Unknown id(s): {ids.ravel().tolist()}')
+        info = np.iinfo(self.ids.dtype)
+        out_of_range = (ids < info.min) | (ids > info.max)
+        candidates = np.where(out_of_range, 0, ids).astype(self.ids.dtype)
+        indices = np.minimum(np.searchsorted(self.ids, candidates), len(self.ids) - 1)
+        missing = out_of_range | (self.ids[indices] != candidates)
+        if missing.any():
+            raise KeyError(f'Unknown id(s): {ids[missing].tolist()}')
+        return indices.astype(np.int32)
+
+    def to_ids(self, indices):
+        """Maps an array of indices to id's."""
+        return self.ids[np.asarray(indices)]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, key):
+        if self.is_inverse:
+            if not 0 <= key < len(self.ids):
+                raise KeyError(key)
+            return self.ids[key]
+        return self.to_index(key).item()
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return np.arange(len(self.ids)) if self.is_inverse else self.ids
+
+    def values(self):
+        return self.ids if self.is_inverse else np.arange(len(self.ids))
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def __iter__(self):
+        return iter(self.keys())
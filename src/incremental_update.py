@@ -0,0 +1,177 @@
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, diags
+import gc
+from src.als import ALS_ARRAYS
+from src.artifact_store import ArtifactStore, DEFAULT_STORE_DIR
+from src.id_mapper import IdMapper
+from src.instrumentation import log_step
+from src.neighbour_table import SUPPORTED_METRICS
+from src.similarity_index import build_similarity_index
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Create Class for Incremental Updates
+class IncrementalUpdater:
+    def __init__(self, store:ArtifactStore=None):
+        """
+        Applies a delta of new ratings to the current artifact version and saves a new one.
+
+        Args:
+            store: ArtifactStore holding the artifacts (artifacts/store by default)
+        """
+        self.store = ArtifactStore() if store is None else store
+
+    def _expand_users(self, X, user_mapper, delta_users):
+        """Inserts the delta's unseen users as empty rows, keeping the user id's sorted."""
+        new_ids = np.setdiff1d(delta_users, user_mapper.ids)
+        if len(new_ids) == 0:
+            return X, user_mapper
+        user_ids = np.union1d(user_mapper.ids, new_ids)
+        # rows only move, so data/indices keep their order and only indptr is rebuilt
+        row_lengths = np.zeros(len(user_ids), dtype=np.int64)
+        row_lengths[np.searchsorted(user_ids, user_mapper.ids)] = np.diff(X.indptr)
+        indptr = np.concatenate(([0], np.cumsum(row_lengths))).astype(X.indptr.dtype)
+        X = csr_matrix((X.data, X.indices, indptr), shape=(len(user_ids), X.shape[1]))
+        logging.info(f"Added {len(new_ids):,} new users")
+        return X, IdMapper(user_ids)
+
+    def _merge_ratings(self, X, rows, cols, ratings):
+        """Returns X with the delta written in (existing (user, movie) ratings are replaced)."""
+        touched = np.unique(rows)
+        old = X[touched].tocoo()
+        old_rows = touched[old.row]
+
+        # delta entries come last so they win when a (user, movie) pair already has a rating
+        all_rows = np.concatenate((old_rows, rows))
+        all_cols = np.concatenate((old.col, cols))
+        all_ratings = np.concatenate((old.data, ratings)).astype(X.dtype)
+        keys = all_rows.astype(np.int64) * X.shape[1] + all_cols
+        last = ~pd.Series(keys).duplicated(keep='last').to_numpy()
+        touched_rows = csr_matrix((all_ratings[last], (all_rows[last], all_cols[last])), shape=X.shape)
+
+        # sums and counts of the replaced ratings, to update the per-movie averages
+        replaced = np.isin(keys[len(old_rows):], keys[:len(old_rows)])
+        old_lookup = pd.Series(old.data, index=keys[:len(old_rows)])
+        replaced_ratings = old_lookup.reindex(keys[len(old_rows):][replaced]).to_numpy()
+
+        untouched = np.ones(X.shape[0], dtype=X.dtype)
+        untouched[touched] = 0
+        X = (diags(untouched) @ X + touched_rows).tocsr()
+        X.sort_indices()
+        return X, replaced, replaced_ratings
+
+    def _update_movies(self, movies, X_old, movie_mapper, cols, ratings, replaced, replaced_ratings):
+        """Updates avg_rating and num_of_rating of the movies whose columns changed."""
+        n_items = len(movie_mapper)
+        added_sum = np.bincount(cols, weights=ratings, minlength=n_items)
+        added_sum -= np.bincount(cols[replaced], weights=replaced_ratings, minlength=n_items)
+        added_count = np.bincount(cols[~replaced], minlength=n_items)
+
+        movies = movies.copy()
+        # movies sharing the title of a popular movie pass the per-title filter without a column in X
+        mapped = np.isin(movies['movieId'].to_numpy(), movie_mapper.ids)
+        positions = movie_mapper.to_index(movies['movieId'][mapped])
+        if 'num_of_rating' not in movies.columns:
+            # legacy artifacts did not keep the counts, use the number of ratings in X
+            movies['num_of_rating'] = 0
+            movies.loc[mapped, 'num_of_rating'] = np.diff(X_old.tocsc().indptr)[positions]
+
+        count = movies.loc[mapped, 'num_of_rating'].to_numpy(dtype=np.float64)
+        total = movies.loc[mapped, 'avg_rating'].to_numpy(dtype=np.float64) * count + added_sum[positions]
+        count = count + added_count[positions]
+        movies.loc[mapped, 'num_of_rating'] = count.astype(np.int64)
+        movies.loc[mapped, 'avg_rating'] = total / np.maximum(count, 1)
+
+        # the statistics of a full rebuild are per title, so an unmapped movie follows the mapped one of its title
+        if not mapped.all():
+            by_title = movies[mapped].drop_duplicates('title').set_index('title')
+            unmapped = ~mapped & movies['title'].isin(by_title.index).to_numpy()
+            for column in ('num_of_rating', 'avg_rating'):
+                movies.loc[unmapped, column] = movies.loc[unmapped, 'title'].map(by_title[column]).to_numpy()
+        return movies
+
+    def _update_tables(self, X, arrays, changed_items):
+        """Recomputes the neighbour rows of the changed items in every saved neighbour table."""
+        # ALS factors are not updated incrementally; stale ones (with fewer user rows than X) are dropped
+        arrays = {name: array for name, array in arrays.items() if name not in ALS_ARRAYS}
+        for metric, algorithm in SUPPORTED_METRICS.items():
+            indices = arrays.get(f'neighbours_{metric}_indices')
+            distances = arrays.get(f'neighbours_{metric}_distances')
+            if indices is None or distances is None:
+                continue
+            with log_step(f'Update neighbours [{metric}]'):
+                index = build_similarity_index(X, metric=metric, algorithm=algorithm)
+                indices, distances = np.array(indices), np.array(distances)
+                new_distances, new_indices = index.kneighbors(changed_items, n_neighbors=indices.shape[1])
+                indices[changed_items] = new_indices
+                distances[changed_items] = new_distances
+                arrays[f'neighbours_{metric}_indices'] = indices
+                arrays[f'neighbours_{metric}_distances'] = distances
+                del index
+                gc.collect()
+        return arrays
+
+    def update(self, delta:pd.DataFrame) -> str:
+        """
+        Appends a delta of ratings and persists a new artifact version.
+
+        Only the neighbours of the items whose columns changed are recomputed, the
+        neighbour lists of the other items are kept as they are. Ratings of movies
+        that are not in X are skipped: adding items needs a full pipeline run since
+        the 50-rating threshold decides which movies are in the catalogue.
+
+        Args:
+            delta: pandas dataframe containing 3 columns (userId, movieId, rating)
+
+        Returns:
+            version: name of the new artifact version
+        """
+        try:
+            artifacts = self.store.load(mmap_mode='r')
+            X, user_mapper, movie_mapper = artifacts.X, artifacts.user_mapper, artifacts.movie_mapper
+
+            # Step 1: Validate the delta (latest rating of a (user, movie) pair wins)
+            delta = delta[['userId', 'movieId', 'rating']].dropna()
+            delta = delta.drop_duplicates(subset=['userId', 'movieId'], keep='last')
+            known = np.isin(delta['movieId'].to_numpy(), movie_mapper.ids)
+            if not known.all():
+                logging.warning(f"Skipped {(~known).sum():,} ratings of movies not in the catalogue")
+            delta = delta[known]
+            if delta.empty:
+                logging.info("No ratings to apply, artifacts unchanged")
+                return artifacts.version
+
+            # Step 2: Append the delta to X
+            with log_step('Append ratings'):
+                X_new, user_mapper = self._expand_users(X, user_mapper, delta['userId'].to_numpy(dtype=np.int64))
+                rows = user_mapper.to_index(delta['userId'])
+                cols = movie_mapper.to_index(delta['movieId'])
+                ratings = delta['rating'].to_numpy(dtype=np.float64)
+                X_new, replaced, replaced_ratings = self._merge_ratings(X_new, rows, cols, ratings)
+
+            # Step 3: Update the per-movie statistics
+            movies = self._update_movies(artifacts.movies, X, movie_mapper, cols, ratings, replaced, replaced_ratings)
+
+            # Step 4: Recompute the neighbours of the changed items
+            changed_items = np.unique(cols)
+            arrays = self._update_tables(X_new, artifacts.arrays, changed_items)
+
+            version = self.store.save(X_new, movie_mapper, user_mapper, movies, arrays=arrays, parent=artifacts.version)
+            logging.info(f"Incremental Update Completed Successfully: {len(delta):,} ratings, "
+                         f"{len(changed_items):,} items updated, version {version}")
+            return version
+        except Exception as e:
+            logging.error(f'Error in Incremental Update: {e}')
+            raise e
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Apply a CSV of new ratings (userId,movieId,rating) to the artifacts")
+    parser.add_argument('delta', help="CSV file with the new ratings")
+    parser.add_argument('--store-dir', default=DEFAULT_STORE_DIR, help="artifact store directory")
+    args = parser.parse_args()
+    IncrementalUpdater(ArtifactStore(args.store_dir)).update(pd.read_csv(args.delta))
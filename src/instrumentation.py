@@ -0,0 +1,263 @@
+import cProfile
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+DEFAULT_REPORT_DIR = os.path.join('artifacts', 'reports')
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, or None if it cannot be measured."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        memory = psutil.Process().memory_info()
+        return getattr(memory, 'peak_wset', memory.rss) / 1024**2
+    return None
+
+
+def current_rss_mb():
+    """Returns the current resident set size of this process in MB, or None if it cannot be measured."""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1024**2
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+# Seconds between two RSS samples of a running step
+DEFAULT_SAMPLE_INTERVAL = 0.01
+
+
+# Create Class for Sampling the RSS of a Running Step
+class _RssSampler:
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        """Samples the current RSS in a background thread from now until stop()."""
+        self.interval = interval
+        self.start_rss = current_rss_mb()
+        self.peak = self.start_rss or 0.0
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+
+    def _sample(self):
+        while not self.done.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb() or 0.0)
+
+    def stop(self):
+        """Returns (peak RSS in MB, RSS delta in MB) of the sampled interval, None where RSS cannot be measured."""
+        self.done.set()
+        self.thread.join()
+        end_rss = current_rss_mb()
+        if end_rss is None:
+            return None, None
+        return max(self.peak, end_rss), end_rss - self.start_rss if self.start_rss is not None else None
+
+
+# Run report that log_step records into (see RunReport.activate)
+_ACTIVE_REPORT = None
+
+
+def active_report():
+    return _ACTIVE_REPORT
+
+
+# Create Class for the Structured Run Report
+class RunReport:
+    def __init__(self, name='run', trace_memory=None, profile=None, profiler=None,
+                 output_dir=DEFAULT_REPORT_DIR, max_records=None, sample_interval=DEFAULT_SAMPLE_INTERVAL):
+        """
+        Collects wall time, CPU time, peak RSS, tracemalloc peak and counts of named stages.
+
+        Stages may be nested; every record keeps the name of its parent stage. While the
+        report is active, every log_step in the code base records into it as well.
+
+        Profiling and tracemalloc are opt-in, either through the arguments or the
+        environment (MRS_PROFILE=clean,fit or MRS_PROFILE=all, MRS_PROFILER=pyinstrument,
+        MRS_TRACEMALLOC=1), so production runs can be profiled without editing code.
+
+        Args:
+            name: name of the run (prefix of the report file)
+            trace_memory: whether to record the tracemalloc peak of every stage
+            profile: stage names (or 'all') to profile
+            profiler: 'cprofile' (default) or 'pyinstrument'
+            output_dir: directory of the JSON report and the profiles
+            max_records: keep only the latest records (for long-running servers)
+            sample_interval: seconds between two RSS samples of a running stage
+        """
+        self.name = name
+        # microseconds keep the reports of runs started within the same second apart
+        self.run_id = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}"
+        self.created = datetime.now(timezone.utc).isoformat()
+        self.trace_memory = os.environ.get('MRS_TRACEMALLOC') == '1' if trace_memory is None else trace_memory
+        profile = os.environ.get('MRS_PROFILE', '') if profile is None else profile
+        self.profile = set(filter(None, profile.split(','))) if isinstance(profile, str) else set(profile)
+        self.profiler = (profiler or os.environ.get('MRS_PROFILER', 'cprofile')).lower()
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.records = deque(maxlen=max_records)
+        self.local = threading.local()
+        self.previous = None
+
+    def activate(self):
+        """Makes log_step record into this report, returns the report."""
+        global _ACTIVE_REPORT
+        self.previous, _ACTIVE_REPORT = _ACTIVE_REPORT, self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        return self
+
+    def deactivate(self):
+        global _ACTIVE_REPORT
+        if _ACTIVE_REPORT is self:
+            _ACTIVE_REPORT = self.previous
+
+    def _stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def _should_profile(self, name):
+        return bool(self.profile) and ('all' in self.profile or name in self.profile)
+
+    def _start_profiler(self, name):
+        if getattr(self.local, 'profiling', False):
+            logging.warning(f'Not profiling nested stage {name}, a profiler is already running')
+            return None
+        self.local.profiling = True
+        if self.profiler == 'pyinstrument':
+            if pyinstrument is not None:
+                profiler = pyinstrument.Profiler()
+                profiler.start()
+                return profiler
+            logging.warning('pyinstrument is not installed, profiling with cProfile')
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def _stop_profiler(self, profiler, name):
+        self.local.profiling = False
+        os.makedirs(os.path.join(self.output_dir, self.run_id), exist_ok=True)
+        path = os.path.join(self.output_dir, self.run_id, re.sub(r'[^\w.-]+', '_', name))
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            path += '.prof'
+            profiler.dump_stats(path)
+        else:
+            profiler.stop()
+            path += '.html'
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+        return path
+
+    @contextmanager
+    def stage(self, name, **counts):
+        """
+        Measures the wrapped stage; counts (rows, nnz, ...) can also be added to the yielded record.
+
+        Args:
+            name: stage name
+            counts: initial counts of the record
+        """
+        stack = self._stack()
+        record = {'name': name, 'parent': stack[-1]['name'] if stack else None,
+                  'started': datetime.now(timezone.utc).isoformat()}
+        record.update(counts)
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            # the parent's peak so far is kept before the peak is reset for this stage
+            if stack:
+                stack[-1]['traced_peak'] = max(stack[-1]['traced_peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        frame = {'name': name, 'traced_start': tracemalloc.get_traced_memory()[0] if tracing else 0, 'traced_peak': 0}
+        stack.append(frame)
+
+        sampler = _RssSampler(self.sample_interval)
+        profiler = self._start_profiler(name) if self._should_profile(name) else None
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if profiler is not None:
+                record['profile'] = self._stop_profiler(profiler, name)
+            peak_rss, rss_delta = sampler.stop()
+            stack.pop()
+            record.update({'wall_s': wall, 'cpu_s': cpu, 'peak_rss_mb': peak_rss, 'rss_delta_mb': rss_delta})
+            if tracing and tracemalloc.is_tracing():
+                traced_peak = max(frame['traced_peak'], tracemalloc.get_traced_memory()[1])
+                record['tracemalloc_peak_mb'] = (traced_peak - frame['traced_start']) / 1024**2
+                if stack:
+                    stack[-1]['traced_peak'] = max(stack[-1]['traced_peak'], traced_peak)
+            self.records.append(record)
+
+            peak_text = 'n/a' if record['peak_rss_mb'] is None else f"{record['peak_rss_mb']:,.0f} MB"
+            logging.info(f'[{name}] wall time: {wall:.2f}s, cpu time: {cpu:.2f}s, peak RSS: {peak_text}')
+
+    def to_dict(self):
+        return {'name': self.name, 'run_id': self.run_id, 'created': self.created, 'pid': os.getpid(),
+                'stages': list(self.records)}
+
+    def save(self, path=None):
+        """Writes the report as JSON (to <output_dir>/<run_id>.json by default) and returns the path."""
+        path = os.path.join(self.output_dir, f'{self.run_id}.json') if path is None else path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
+        logging.info(f'Saved run report: {path}')
+        return path
+
+
+@contextmanager
+def log_step(name):
+    """Logs the wall time, peak RSS and RSS delta of the wrapped step, and records it into the active run report."""
+    report = active_report()
+    if report is not None:
+        with report.stage(name) as record:
+            yield record
+        return
+    sampler = _RssSampler()
+    start = time.perf_counter()
+    try:
+        yield {}
+    finally:
+        peak, delta = sampler.stop()
+    wall = time.perf_counter() - start
+    if peak is not None:
+        memory = f'peak RSS: {peak:,.0f} MB, RSS delta: {delta:+,.0f} MB'
+    else:
+        # without the current RSS only the process-lifetime peak is known, which never goes down
+        process_peak = peak_rss_mb()
+        memory = 'peak RSS: n/a' if process_peak is None else f'process peak RSS: {process_peak:,.0f} MB'
+    logging.info(f'[{name}] wall time: {wall:.2f}s, {memory}')
@@ -1,52 +1,75 @@
 import logging
 import pandas as pd
-import numpy as np
-from sklearn.neighbors import NearestNeighbors
+from src.similarity_index import get_similarity_index
+from src.id_mapper import IdMapper
 
 # Setup logging Configuration
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
 # Create Class for Model Training
 class ModelTraining:
-    def __init__(self, movie_id, X, movie_mapper, movie_inv_mapper, k, metric, algorithm):
+    def __init__(self, movie_id, X, movie_mapper, movie_inv_mapper, k, metric, algorithm, index=None, n_workers=None):
         """
         Finds k-nearest neighbours for a given movie id.
         
         Args:
             movie_id: id of the movie of interest
             X: user-item utility matrix
-            movie_mapper: dict that maps movie id's to movie indices
-            movie_inv_mapper: dict that maps movie indices to movie id's
+            movie_mapper: IdMapper (or dict) that maps movie id's to movie indices
+            movie_inv_mapper: IdMapper (or dict) that maps movie indices to movie id's
             k: number of similar movies to retrieve
             metric: distance metric for kNN calculations
+            algorithm: algorithm used by the kNN model
+            index: fitted similarity index or NeighbourTable to query (shared per metric/algorithm if None)
+            n_workers: worker processes of the shared index when index is None (sharded exact kNN, see
+                ShardedSimilarityIndex), None queries in this process
         
         Output: returns list of k similar movie ID's
         """
         self.movie_id = movie_id
         self.X = X
+        # legacy pickled dicts are wrapped into array-backed mappers
+        if isinstance(movie_mapper, dict):
+            movie_mapper = IdMapper.from_dict(movie_mapper)
+        if isinstance(movie_inv_mapper, dict):
+            movie_inv_mapper = IdMapper.from_dict(movie_inv_mapper, inverse=True)
         self.movie_mapper = movie_mapper
         self.movie_inv_mapper = movie_inv_mapper
         self.k = k
         self.metric = metric
         self.algorithm = algorithm
+        self.index = index
+        self.n_workers = n_workers
     
-    def find_similar_movies(self):
+    def find_similar_movies_batch(self, movie_ids):
+        """
+        Finds the similar movies of many movies with a single kNN query.
+        
+        Args:
+            movie_ids: array of movie id's of interest
+        
+        Returns:
+            neighbour_ids: array of shape (n_movies, k-1) with the similar movie id's of each movie
+            distances: array of shape (n_movies, k-1) with the matching distances
+        """
         try:
-            X = self.X.T
-            neighbour_ids = []
+            if self.index is None:
+                self.index = get_similarity_index(self.X, self.metric, self.algorithm, n_workers=self.n_workers)
             
-            movie_ind = self.movie_mapper[self.movie_id]
-            movie_vec = X[movie_ind]
-            if isinstance(movie_vec, (np.ndarray)):
-                movie_vec = movie_vec.reshape(1,-1)
+            movie_inds = self.movie_mapper.to_index(movie_ids)
             # use k+1 since kNN output includes the movieId of interest
-            kNN = NearestNeighbors(n_neighbors=self.k+1, algorithm=self.algorithm, metric=self.metric)
-            kNN.fit(X)
-            neighbour = kNN.kneighbors(movie_vec, return_distance=False)
-            for i in range(0,self.k):
-                n = neighbour.item(i)
-                neighbour_ids.append(self.movie_inv_mapper[n])
-            neighbour_ids.pop(0)
+            distances, neighbours = self.index.kneighbors(movie_inds, n_neighbors=self.k+1, return_distance=True)
+            # keep the first k neighbours and drop the movie of interest, as find_similar_movies does
+            neighbour_ids = self.movie_inv_mapper.to_ids(neighbours[:, 1:self.k])
+            return neighbour_ids, distances[:, 1:self.k]
+        except Exception as e:
+            logging.error(f'Error in Batch Model Training: {e}')
+            raise e
+    
+    def find_similar_movies(self):
+        try:
+            neighbour_ids, _ = self.find_similar_movies_batch([self.movie_id])
+            neighbour_ids = neighbour_ids[0].tolist()
             logging.info('Item-Item Collaborative Filtering Model Training Completed Successfully')
             logging.info(f'Params: k:{self.k}, metric:{self.metric}, algorithm:{self.algorithm}')
             return neighbour_ids
@@ -0,0 +1,133 @@
+import logging
+import numpy as np
+import gc
+from src.artifact_store import ArtifactStore
+from src.similarity_index import build_similarity_index
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Metrics (and the kNN algorithm used for each) served by the app
+SUPPORTED_METRICS = {'cosine': 'brute', 'manhattan': 'auto'}
+
+# Create Class for the Precomputed Neighbour Table
+class NeighbourTable:
+    def __init__(self, indices, distances, metric):
+        """
+        Precomputed top-K neighbours of every item, answering queries by array lookup.
+
+        Args:
+            indices: int32 array of shape (n_items, K) with neighbour item indices
+            distances: float32 array of shape (n_items, K) with neighbour distances
+            metric: distance metric the table was computed with
+        """
+        self.indices = indices
+        self.distances = distances
+        self.metric = metric
+
+    @property
+    def n_neighbors(self):
+        return self.indices.shape[1]
+
+    def kneighbors(self, item_indices, n_neighbors, return_distance=True):
+        """Same contract as the similarity indexes' kneighbors, served from the table."""
+        if n_neighbors > self.n_neighbors:
+            raise ValueError(f"Neighbour table only holds {self.n_neighbors} neighbours, {n_neighbors} requested")
+        item_indices = np.atleast_1d(np.asarray(item_indices, dtype=np.int64))
+        neighbours = self.indices[item_indices, :n_neighbors]
+        if return_distance:
+            return self.distances[item_indices, :n_neighbors], neighbours
+        return neighbours
+
+    def save(self, store=None):
+        """Adds the table to the current artifact store version as two arrays."""
+        store = ArtifactStore() if store is None else store
+        store.save_arrays({f'neighbours_{self.metric}_indices': self.indices,
+                           f'neighbours_{self.metric}_distances': self.distances})
+
+    @classmethod
+    def from_arrays(cls, arrays, metric):
+        """Builds the table from a dict of named arrays (e.g. Artifacts.arrays), None if it is missing."""
+        indices = arrays.get(f'neighbours_{metric}_indices')
+        distances = arrays.get(f'neighbours_{metric}_distances')
+        if indices is None or distances is None:
+            return None
+        return cls(indices, distances, metric)
+
+    @classmethod
+    def load(cls, metric, store=None, mmap_mode='r'):
+        """Loads a saved table from the current store version, returns None if it has not been built."""
+        store = ArtifactStore() if store is None else store
+        if store.current_version() is None:
+            return None
+        manifest = store.read_manifest()
+        arrays = {name: store.load_array(name, mmap_mode=mmap_mode, manifest=manifest)
+                  for name in (f'neighbours_{metric}_indices', f'neighbours_{metric}_distances')}
+        return cls.from_arrays(arrays, metric)
+
+
+# Create Class for Building the Neighbour Tables
+class NeighbourTableBuilder:
+    def __init__(self, k=50, block_size=2048, n_jobs=-1, n_workers=None):
+        """
+        Computes the top-K neighbours of every item in X.
+
+        Args:
+            k: number of neighbours stored per item (the item itself is usually the first one)
+            block_size: number of items queried per kNN call
+            n_jobs: number of cores used by each kNN call (-1 uses all cores)
+            n_workers: worker processes sharing X through shared memory (see ShardedSimilarityIndex),
+                None computes the table in this process
+        """
+        self.k = k
+        self.block_size = block_size
+        self.n_jobs = n_jobs
+        self.n_workers = n_workers
+
+    def build_table(self, X, metric='cosine', algorithm='brute'):
+        """Builds the neighbour table of one metric, processing the items in blocks."""
+        try:
+            index = build_similarity_index(X, metric=metric, algorithm=algorithm, n_jobs=self.n_jobs,
+                                           n_workers=self.n_workers)
+            n_items = index.n_items
+            k = min(self.k, n_items)
+            indices = np.empty((n_items, k), dtype=np.int32)
+            distances = np.empty((n_items, k), dtype=np.float32)
+
+            for start in range(0, n_items, self.block_size):
+                stop = min(start + self.block_size, n_items)
+                block_distances, block_indices = index.kneighbors(np.arange(start, stop), n_neighbors=k)
+                indices[start:stop] = block_indices
+                distances[start:stop] = block_distances
+                logging.info(f'Neighbour Table [{metric}]: {stop}/{n_items} items')
+
+            # the sharded index holds worker processes and shared memory
+            if hasattr(index, 'close'):
+                index.close()
+            del index
+            gc.collect()
+            return NeighbourTable(indices, distances, metric)
+        except Exception as e:
+            logging.error(f'Error in Building Neighbour Table: {e}')
+            raise e
+
+    def build(self, X, metrics=None, store=None):
+        """
+        Builds and saves the neighbour tables of every supported metric.
+
+        Args:
+            X: user-item utility matrix
+            metrics: dict mapping metric to kNN algorithm (defaults to SUPPORTED_METRICS)
+            store: ArtifactStore whose current version the tables are saved into
+
+        Returns:
+            tables: dict mapping metric to its NeighbourTable
+        """
+        metrics = SUPPORTED_METRICS if metrics is None else metrics
+        tables = {}
+        for metric, algorithm in metrics.items():
+            table = self.build_table(X, metric=metric, algorithm=algorithm)
+            table.save(store)
+            tables[metric] = table
+        logging.info('Neighbour Tables Built Successfully')
+        return tables
@@ -0,0 +1,158 @@
+import logging
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from src.cosine_engine import top_n
+from src.id_mapper import IdMapper
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Create Class for Personalised (User-Based) Recommendations
+class PersonalizedRecommender:
+    def __init__(self, X, movie_mapper, movie_inv_mapper, user_mapper=None, center=True):
+        """
+        Recommends movies for a whole rating history instead of a single movie.
+
+        Every candidate item is scored with the sum of its cosine similarities to the
+        rated movies, weighted by the ratings: scores = Xn^T (Xn r), where Xn is X with
+        L2-normalised item columns. For a single history both products are sparse and
+        only touch the users who rated one of its movies, so the item-item matrix is never built.
+
+        Args:
+            X: user-item utility matrix (users x items)
+            movie_mapper: IdMapper (or dict) that maps movie id's to column indices
+            movie_inv_mapper: IdMapper (or dict) that maps column indices to movie id's
+            user_mapper: IdMapper (or dict) that maps user id's to row indices, needed for userId queries
+            center: whether to subtract the user's mean rating, so disliked movies push candidates down
+        """
+        self.X = X
+        self.movie_mapper = IdMapper.from_dict(movie_mapper) if isinstance(movie_mapper, dict) else movie_mapper
+        self.movie_inv_mapper = IdMapper.from_dict(movie_inv_mapper, inverse=True) if isinstance(movie_inv_mapper, dict) else movie_inv_mapper
+        self.user_mapper = IdMapper.from_dict(user_mapper) if isinstance(user_mapper, dict) else user_mapper
+        self.center = center
+        self.item_matrix = None
+        self.user_matrix = None
+
+    @property
+    def n_items(self):
+        return self.X.shape[1]
+
+    def fit(self):
+        """L2-normalises the item columns and keeps both item-user and user-item layouts."""
+        try:
+            self.item_matrix = normalize(csr_matrix(self.X.T, dtype=np.float32), norm='l2', axis=1)
+            self.user_matrix = self.item_matrix.T.tocsr()
+            logging.info(f'Personalized Recommender Fitted: {self.X.shape[0]:,} users, {self.n_items:,} items')
+            return self
+        except Exception as e:
+            logging.error(f'Error in Fitting Personalized Recommender: {e}')
+            raise e
+
+    def _weights(self, history):
+        """Turns a CSR matrix of rating histories (one row per query) into similarity weights."""
+        weights = csr_matrix(history, dtype=np.float32, copy=True)
+        if self.center:
+            rows = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+            counts = np.maximum(np.diff(weights.indptr), 1)
+            means = np.bincount(rows, weights=weights.data, minlength=weights.shape[0]) / counts
+            centered = weights.data - means[rows]
+            # a history of equal ratings carries no preference once centered, keep the raw ratings
+            flat = np.bincount(rows, weights=np.abs(centered), minlength=weights.shape[0]) == 0
+            weights.data = np.where(flat[rows], weights.data, centered).astype(np.float32)
+        return weights
+
+    def _score(self, history):
+        """Dense (n_queries x n_items) scores with the already-rated items set to -inf."""
+        if self.item_matrix is None:
+            self.fit()
+        weights = self._weights(history)
+        if weights.shape[0] == 1:
+            # one history only touches the users who rated its movies, so stay sparse
+            scores = ((weights @ self.item_matrix) @ self.user_matrix).toarray()
+        else:
+            # a block of histories touches most users, two sparse x dense products are cheaper
+            scores = (self.item_matrix @ (self.user_matrix @ weights.T.toarray())).T
+        seen_rows = np.repeat(np.arange(weights.shape[0]), np.diff(weights.indptr))
+        scores[seen_rows, weights.indices] = -np.inf
+        return scores
+
+    def _single(self, history, n):
+        top, scores = top_n(self._score(history), n)
+        keep = np.isfinite(scores[0])
+        return self.movie_inv_mapper.to_ids(top[0][keep]), scores[0][keep]
+
+    def recommend_for_user(self, user_id, n=12):
+        """
+        Recommends unseen movies for a user of X.
+
+        Args:
+            user_id: userId of a row of X
+            n: number of recommendations
+
+        Returns:
+            (movie ids, scores), best first
+        """
+        try:
+            if self.user_mapper is None:
+                raise ValueError('user_mapper is required for userId queries')
+            row = self.user_mapper.to_index([user_id])
+            return self._single(self.X[row], n)
+        except Exception as e:
+            logging.error(f'Error in Personalized Recommendation: {e}')
+            raise e
+
+    def recommend_from_ratings(self, ratings, n=12):
+        """
+        Recommends unseen movies for an ad-hoc rating history.
+
+        Args:
+            ratings: dict {movieId: rating} or iterable of (movieId, rating) pairs
+            n: number of recommendations
+
+        Returns:
+            (movie ids, scores), best first
+        """
+        try:
+            # the latest rating of a movie wins, as in the incremental update
+            pairs = list(dict(ratings).items())
+            movie_ids = np.array([movie_id for movie_id, _ in pairs], dtype=np.int64)
+            values = np.array([rating for _, rating in pairs], dtype=np.float32)
+            known = np.isin(movie_ids, self.movie_mapper.ids)
+            if not known.all():
+                logging.warning(f"Skipped {(~known).sum():,} ratings of movies not in the catalogue")
+            if not known.any():
+                return self.movie_inv_mapper.to_ids(np.array([], dtype=np.int64)), np.array([], dtype=np.float32)
+            cols = self.movie_mapper.to_index(movie_ids[known])
+            history = csr_matrix((values[known], (np.zeros(len(cols), dtype=np.int32), cols)), shape=(1, self.n_items))
+            return self._single(history, n)
+        except Exception as e:
+            logging.error(f'Error in Personalized Recommendation: {e}')
+            raise e
+
+    def recommend_batch(self, user_ids=None, n=12, batch_size=64):
+        """
+        Scores many users of X (all of them by default) for offline use.
+
+        Args:
+            user_ids: array of userIds, None for every row of X
+            n: number of recommendations per user
+            batch_size: users scored per block (bounds the dense n_users x batch_size intermediate)
+
+        Returns:
+            (movie ids, scores) of shape (n_users, n), best first; rows of users who rated
+            almost every movie are padded with -inf scores
+        """
+        try:
+            rows = np.arange(self.X.shape[0]) if user_ids is None else self.user_mapper.to_index(user_ids)
+            n = min(n, self.n_items)
+            top = np.empty((len(rows), n), dtype=np.int64)
+            top_scores = np.empty((len(rows), n), dtype=np.float32)
+            for start in range(0, len(rows), batch_size):
+                block = rows[start:start + batch_size]
+                top[start:start + len(block)], top_scores[start:start + len(block)] = top_n(self._score(self.X[block]), n)
+            logging.info(f'Scored {len(rows):,} users')
+            return self.movie_inv_mapper.to_ids(top), top_scores
+        except Exception as e:
+            logging.error(f'Error in Batch Personalized Recommendation: {e}')
+            raise e
@@ -0,0 +1,197 @@
+import argparse
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+TMDB_API_URL = "https://api.themoviedb.org/3"
+TMDB_IMAGE_URL = "https://image.tmdb.org/t/p/w500"
+TMDB_API_KEY = os.environ.get('TMDB_API_KEY', '8265bd1679663a7ea12ac168da84d2e8')
+PLACEHOLDER_POSTER = "https://placehold.co/500x750/333/FFFFFF?text=No+Poster"
+DEFAULT_CACHE_PATH = os.path.join('artifacts', 'poster_cache.sqlite')
+
+# Create Class for the Disk-Backed Poster Cache
+class PosterCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl=30 * 86400, negative_ttl=86400, max_entries=200_000):
+        """
+        SQLite cache of poster URLs keyed by tmdbId, shared by every process on the machine.
+
+        Movies without a poster are stored as negative entries (NULL url) with their own,
+        shorter TTL. Once the cache holds more than max_entries, the least recently
+        used entries are evicted.
+
+        Args:
+            path: SQLite file of the cache
+            ttl: seconds a poster URL stays valid
+            negative_ttl: seconds a "no poster" entry stays valid
+            max_entries: maximum number of cached tmdbIds
+        """
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS posters ("
+                "tmdb_id INTEGER PRIMARY KEY, url TEXT, fetched_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self.connection.execute("CREATE INDEX IF NOT EXISTS posters_accessed ON posters (accessed_at)")
+
+    def get_many(self, tmdb_ids):
+        """Returns {tmdb_id: url or None} for the ids with a fresh entry (None marks a negative entry)."""
+        if not tmdb_ids:
+            return {}
+        now = time.time()
+        found = {}
+        with self.lock, self.connection:
+            ids = list(tmdb_ids)
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                rows = self.connection.execute(
+                    f"SELECT tmdb_id, url, fetched_at FROM posters WHERE tmdb_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for tmdb_id, url, fetched_at in rows:
+                    if now - fetched_at <= (self.ttl if url is not None else self.negative_ttl):
+                        found[tmdb_id] = url
+            if found:
+                self.connection.executemany("UPDATE posters SET accessed_at = ? WHERE tmdb_id = ?",
+                                            [(now, tmdb_id) for tmdb_id in found])
+        return found
+
+    def put_many(self, entries):
+        """Stores {tmdb_id: url or None} and evicts the least recently used entries beyond max_entries."""
+        if not entries:
+            return
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO posters (tmdb_id, url, fetched_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(tmdb_id, url, now, now) for tmdb_id, url in entries.items()]
+            )
+            (count,) = self.connection.execute("SELECT COUNT(*) FROM posters").fetchone()
+            if count > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM posters WHERE tmdb_id IN (SELECT tmdb_id FROM posters ORDER BY accessed_at LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+
+    def close(self):
+        self.connection.close()
+
+
+# Create Class for the Concurrent Poster Resolver
+class PosterResolver:
+    def __init__(self, cache:PosterCache=None, api_url=TMDB_API_URL, image_url=TMDB_IMAGE_URL,
+                 api_key=TMDB_API_KEY, max_workers=12, timeout=5, batch_timeout=8):
+        """
+        Resolves TMDB poster URLs for whole result sets at once.
+
+        Cache misses are fetched concurrently over one pooled requests.Session, so a
+        page of recommendations costs about one round-trip instead of one per movie.
+
+        Args:
+            cache: PosterCache consulted before any request (artifacts/poster_cache.sqlite by default)
+            api_url: base URL of the TMDB API (a local stub server in tests)
+            image_url: base URL prepended to the poster paths
+            api_key: TMDB API key
+            max_workers: number of concurrent requests (and pooled connections)
+            timeout: timeout of one request in seconds
+            batch_timeout: time budget of one resolve() call in seconds
+        """
+        self.cache = PosterCache() if cache is None else cache
+        self.api_url = api_url.rstrip('/')
+        self.image_url = image_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.batch_timeout = batch_timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='poster')
+
+    def _fetch(self, tmdb_id):
+        """Returns (tmdb_id, poster URL or None); raises on transient errors so they are not cached."""
+        response = self.session.get(f"{self.api_url}/movie/{tmdb_id}",
+                                    params={'api_key': self.api_key, 'language': 'en-US'}, timeout=self.timeout)
+        if response.status_code == 404:
+            return tmdb_id, None
+        response.raise_for_status()
+        poster_path = response.json().get('poster_path')
+        return tmdb_id, f"{self.image_url}{poster_path}" if poster_path else None
+
+    def resolve(self, tmdb_ids):
+        """
+        Returns the poster URL of every tmdbId, in order (placeholder if there is none).
+
+        Args:
+            tmdb_ids: iterable of tmdbIds (NaN/None for movies without one)
+
+        Returns:
+            list of poster URLs
+        """
+        keys = [None if tmdb_id is None or math.isnan(float(tmdb_id)) else int(tmdb_id) for tmdb_id in tmdb_ids]
+        wanted = {key for key in keys if key is not None}
+        found = self.cache.get_many(wanted)
+
+        misses = wanted - found.keys()
+        if misses:
+            futures = {self.executor.submit(self._fetch, tmdb_id): tmdb_id for tmdb_id in misses}
+            done, not_done = wait(futures, timeout=self.batch_timeout)
+            fetched = {}
+            for future in done:
+                try:
+                    tmdb_id, url = future.result()
+                    fetched[tmdb_id] = url
+                except Exception as e:
+                    # the message of a request error holds the URL with the api_key, so it is not logged
+                    status = getattr(getattr(e, 'response', None), 'status_code', None)
+                    logging.warning(f"Poster request failed: tmdbId:{futures[future]}, "
+                                    f"{f'status:{status}' if status is not None else type(e).__name__}")
+            for future in not_done:
+                future.cancel()
+            self.cache.put_many(fetched)
+            found.update(fetched)
+
+        return [(found.get(key) if key is not None else None) or PLACEHOLDER_POSTER for key in keys]
+
+    def prefetch(self, tmdb_ids, batch_size=200):
+        """Warms the cache for many tmdbIds (e.g. the whole catalogue) in batches."""
+        tmdb_ids = list(tmdb_ids)
+        for start in range(0, len(tmdb_ids), batch_size):
+            self.resolve(tmdb_ids[start:start + batch_size])
+            logging.info(f"Prefetched posters: {min(start + batch_size, len(tmdb_ids))}/{len(tmdb_ids)}")
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+        self.cache.close()
+
+
+if __name__ == '__main__':
+    from src.artifact_store import ArtifactStore, DEFAULT_STORE_DIR
+
+    parser = argparse.ArgumentParser(description="Warm the poster cache for the whole catalogue")
+    parser.add_argument('--store-dir', default=DEFAULT_STORE_DIR, help="artifact store directory")
+    parser.add_argument('--cache-path', default=DEFAULT_CACHE_PATH, help="SQLite poster cache")
+    parser.add_argument('--batch-size', type=int, default=200, help="tmdbIds resolved per batch")
+    args = parser.parse_args()
+
+    movies = ArtifactStore(args.store_dir).load().movies
+    resolver = PosterResolver(cache=PosterCache(args.cache_path), batch_timeout=60)
+    resolver.prefetch(movies['movie_id'].dropna().astype(int).unique().tolist(), batch_size=args.batch_size)
+    resolver.close()
@@ -0,0 +1,215 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+DEFAULT_CACHE_PATH = os.path.join('artifacts', 'recommendation_cache.sqlite')
+
+# Share of max_disk_bytes the shared level is trimmed down to once it is over budget
+DISK_LOW_WATER = 0.9
+
+# Create Class for the Recommendation Cache
+class RecommendationCache:
+    def __init__(self, max_bytes=64 * 1024**2, disk_path=None, namespace='', max_disk_bytes=512 * 1024**2,
+                 prune=True):
+        """
+        Size-bounded LRU cache of neighbour results keyed by (movieId, metric, algorithm, k).
+
+        Values are compact arrays (int32 neighbour movieIds, float32 distances). An
+        optional SQLite file is used as a second level shared by every worker process;
+        namespace (e.g. the artifact version) keeps entries of different artifacts apart.
+        Both levels are size-bounded: once the shared level holds more than
+        max_disk_bytes, its least recently used entries are deleted down to
+        DISK_LOW_WATER of the budget. Its size is a counter row kept by triggers, so
+        every process sees the same total without summing the table.
+
+        Args:
+            max_bytes: memory budget of the in-process level
+            disk_path: SQLite file of the shared level (None keeps the cache in memory only)
+            namespace: prefix of every key
+            max_disk_bytes: budget of the array bytes held by the shared level
+            prune: whether entries of other namespaces (older artifact versions) are deleted on open
+        """
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.namespace = str(namespace)
+        self.entries = OrderedDict()
+        self.n_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.connection = None
+        if disk_path is not None:
+            if os.path.dirname(disk_path):
+                os.makedirs(os.path.dirname(disk_path), exist_ok=True)
+            self.connection = sqlite3.connect(disk_path, check_same_thread=False, timeout=30)
+            with self.lock, self.connection:
+                self.connection.execute("PRAGMA journal_mode=WAL")
+                columns = {row[1] for row in self.connection.execute("PRAGMA table_info(neighbours)")}
+                if columns and 'accessed_at' not in columns:
+                    # cache files of the unbounded layout are rebuilt, their entries are only a cache
+                    self.connection.execute("DROP TABLE neighbours")
+                    self.connection.execute("DROP TABLE IF EXISTS neighbours_size")
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS neighbours (key TEXT PRIMARY KEY, namespace TEXT NOT NULL, "
+                    "ids BLOB NOT NULL, distances BLOB NOT NULL, n_bytes INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+                )
+                self.connection.execute("CREATE INDEX IF NOT EXISTS neighbours_accessed ON neighbours (accessed_at)")
+                # running total of n_bytes, updated in the transaction of every write
+                self.connection.execute("CREATE TABLE IF NOT EXISTS neighbours_size "
+                                        "(id INTEGER PRIMARY KEY CHECK (id = 0), n_bytes INTEGER NOT NULL)")
+                self.connection.execute("INSERT OR IGNORE INTO neighbours_size (id, n_bytes) "
+                                        "SELECT 0, COALESCE(SUM(n_bytes), 0) FROM neighbours")
+                for event, change in (('INSERT', 'NEW.n_bytes'), ('DELETE', '-OLD.n_bytes'),
+                                      ('UPDATE OF n_bytes', 'NEW.n_bytes - OLD.n_bytes')):
+                    name = event.split()[0].lower()
+                    self.connection.execute(
+                        f"CREATE TRIGGER IF NOT EXISTS neighbours_size_{name} AFTER {event} ON neighbours "
+                        f"BEGIN UPDATE neighbours_size SET n_bytes = n_bytes + {change} WHERE id = 0; END"
+                    )
+                if prune:
+                    deleted = self.connection.execute("DELETE FROM neighbours WHERE namespace != ?",
+                                                      (self.namespace,)).rowcount
+                    if deleted:
+                        logging.info(f'Pruned {deleted:,} recommendation cache entries of other artifact versions')
+
+    def _key(self, movie_id, metric, algorithm, k):
+        return f'{self.namespace}:{int(movie_id)}:{metric}:{algorithm}:{int(k)}'
+
+    def _remember(self, key, value):
+        """Adds an entry to the memory level and evicts the least recently used ones over budget."""
+        size = value[0].nbytes + value[1].nbytes
+        if key in self.entries:
+            old = self.entries.pop(key)
+            self.n_bytes -= old[0].nbytes + old[1].nbytes
+        self.entries[key] = value
+        self.n_bytes += size
+        while self.n_bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.n_bytes -= evicted[0].nbytes + evicted[1].nbytes
+
+    def _lookup(self, key):
+        """Returns (value, level) with level 'memory' or 'disk', or (None, None); the caller holds the lock."""
+        value = self.entries.get(key)
+        if value is not None:
+            self.entries.move_to_end(key)
+            return value, 'memory'
+        if self.connection is not None:
+            row = self.connection.execute("SELECT ids, distances FROM neighbours WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                with self.connection:
+                    self.connection.execute("UPDATE neighbours SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                value = (np.frombuffer(row[0], dtype=np.int32), np.frombuffer(row[1], dtype=np.float32))
+                self._remember(key, value)
+                return value, 'disk'
+        return None, None
+
+    def get(self, movie_id, metric, algorithm, k):
+        """Returns (neighbour ids, distances) or None on a miss."""
+        with self.lock:
+            value, level = self._lookup(self._key(movie_id, metric, algorithm, k))
+            if level == 'memory':
+                self.hits += 1
+            elif level == 'disk':
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+            return value
+
+    def put_many(self, movie_ids, metric, algorithm, k, neighbour_ids, distances):
+        """Stores one row of neighbour ids / distances per movieId, evicting the least recently used ones over budget."""
+        neighbour_ids = np.asarray(neighbour_ids, dtype=np.int32)
+        distances = np.asarray(distances, dtype=np.float32)
+        rows = []
+        with self.lock:
+            for movie_id, ids, dist in zip(movie_ids, neighbour_ids, distances):
+                key = self._key(movie_id, metric, algorithm, k)
+                value = (ids.copy(), dist.copy())
+                self._remember(key, value)
+                rows.append((key, self.namespace, value[0].tobytes(), value[1].tobytes(),
+                             value[0].nbytes + value[1].nbytes, time.time()))
+            if self.connection is not None and rows:
+                with self.connection:
+                    # an upsert, not INSERT OR REPLACE: replacing deletes without firing the size trigger
+                    self.connection.executemany(
+                        "INSERT INTO neighbours (key, namespace, ids, distances, n_bytes, accessed_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET ids = excluded.ids, "
+                        "distances = excluded.distances, n_bytes = excluded.n_bytes, accessed_at = excluded.accessed_at",
+                        rows
+                    )
+                    (n_bytes,) = self.connection.execute("SELECT n_bytes FROM neighbours_size WHERE id = 0").fetchone()
+                    if n_bytes > self.max_disk_bytes:
+                        # keep the most recently used entries that fit under the low-water mark, so the
+                        # next writes do not trim again
+                        self.connection.execute(
+                            "DELETE FROM neighbours WHERE key IN (SELECT key FROM (SELECT key, SUM(n_bytes) OVER "
+                            "(ORDER BY accessed_at DESC, key) AS kept FROM neighbours) WHERE kept > ?)",
+                            (int(self.max_disk_bytes * DISK_LOW_WATER),)
+                        )
+
+    def get_or_compute(self, movie_ids, metric, algorithm, k, compute):
+        """
+        Returns the cached neighbours of many movies, computing the misses in one batch.
+
+        Args:
+            movie_ids: array of movieIds
+            metric, algorithm, k: parameters of the kNN query (part of the key)
+            compute: function mapping an array of movieIds to (neighbour id matrix, distance matrix)
+
+        Returns:
+            list of (neighbour ids, distances), one per movieId
+        """
+        results = [self.get(movie_id, metric, algorithm, k) for movie_id in movie_ids]
+        missing = [movie_id for movie_id, result in zip(movie_ids, results) if result is None]
+        if missing:
+            neighbour_ids, distances = compute(np.asarray(missing))
+            self.put_many(missing, metric, algorithm, k, neighbour_ids, distances)
+            computed = {movie_id: (np.asarray(ids, dtype=np.int32), np.asarray(dist, dtype=np.float32))
+                        for movie_id, ids, dist in zip(missing, neighbour_ids, distances)}
+            results = [computed[movie_id] if result is None else result for movie_id, result in zip(movie_ids, results)]
+        return results
+
+    def prewarm(self, movie_ids, metric, algorithm, k, compute, batch_size=1024):
+        """Fills the cache for the given movies (e.g. the N most-rated ones) in batches."""
+        movie_ids = np.asarray(movie_ids)
+        # entries another worker already wrote to the shared level are loaded, not recomputed
+        with self.lock:
+            missing = np.array([movie_id for movie_id in movie_ids
+                                if self._lookup(self._key(movie_id, metric, algorithm, k))[0] is None],
+                               dtype=movie_ids.dtype)
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            neighbour_ids, distances = compute(batch)
+            self.put_many(batch, metric, algorithm, k, neighbour_ids, distances)
+        logging.info(f'Pre-warmed recommendation cache: {len(movie_ids):,} movies ({metric}, {algorithm}, k={k})')
+
+    def stats(self):
+        """Hit/miss counters and size of the memory level."""
+        with self.lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.n_bytes,
+            }
+
+
+def most_rated_movies(X, movie_inv_mapper, n=500):
+    """Returns the movieIds of the n movies with the most ratings in X."""
+    counts = np.bincount(X.indices, minlength=X.shape[1])
+    n = min(n, len(counts))
+    if n <= 0:
+        return movie_inv_mapper.to_ids(np.array([], dtype=np.int64))
+    top = np.argpartition(counts, len(counts) - n)[len(counts) - n:]
+    top = top[np.argsort(counts[top])[::-1]]
+    return movie_inv_mapper.to_ids(top)
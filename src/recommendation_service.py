@@ -0,0 +1,320 @@
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from src.artifact_store import ArtifactStore
+from src.catalogue import ServingCatalogue
+from src.model_training import ModelTraining
+from src.neighbour_table import NeighbourTable, SUPPORTED_METRICS
+from src.personalized import PersonalizedRecommender
+from src.als import ALSModel
+from src.similarity_index import build_similarity_index
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MAX_K = 100
+DEFAULT_K = 12
+
+# Algorithms served per metric: the neighbour-table one plus the approximate index (ALS factors are cosine only)
+SERVED_ALGORITHMS = {metric: (algorithm, 'ann') + (('als',) if metric == 'cosine' else ())
+                     for metric, algorithm in SUPPORTED_METRICS.items()}
+
+# Create Class for Latency Metrics
+class LatencyStats:
+    def __init__(self, window=10_000):
+        """Keeps the latencies (seconds) of the last `window` requests and reports percentiles."""
+        self.latencies = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, latency, error=False):
+        with self.lock:
+            self.latencies.append(latency)
+            self.count += 1
+            self.errors += int(error)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies)
+            count, errors = self.count, self.errors
+        summary = {'requests': count, 'errors': errors}
+        if len(latencies):
+            summary.update({
+                'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                'p99_ms': float(np.percentile(latencies, 99) * 1000),
+                'max_ms': float(latencies.max() * 1000),
+            })
+        return summary
+
+
+# Create Class for Micro-Batching kNN Queries
+class MicroBatcher:
+    def __init__(self, get_model, max_batch_size=256, max_wait_ms=2.0):
+        """
+        Collects concurrent requests and answers them with one vectorized kNN call per group.
+
+        The dispatcher thread takes the first queued request, waits at most max_wait_ms
+        for more, groups them by (metric, algorithm, k) and calls
+        ModelTraining.find_similar_movies_batch once per group.
+
+        Args:
+            get_model: function (metric, algorithm, k) -> ModelTraining
+            max_batch_size: maximum number of requests per batch
+            max_wait_ms: time the dispatcher waits to fill a batch
+        """
+        self.get_model = get_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.batched_requests = 0
+        self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, movie_id, metric, algorithm, k):
+        """Queues a query and returns a Future of (neighbour ids, distances)."""
+        future = Future()
+        self.requests.put((movie_id, metric, algorithm, k, future))
+        return future
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.batched_requests += len(batch)
+            groups = {}
+            for movie_id, metric, algorithm, k, future in batch:
+                groups.setdefault((metric, algorithm, k), []).append((movie_id, future))
+            for (metric, algorithm, k), items in groups.items():
+                try:
+                    movie_ids = np.array([movie_id for movie_id, _ in items])
+                    unique_ids, positions = np.unique(movie_ids, return_inverse=True)
+                    neighbour_ids, distances = self.get_model(metric, algorithm, k).find_similar_movies_batch(unique_ids)
+                    for (_, future), position in zip(items, positions):
+                        future.set_result((neighbour_ids[position], distances[position]))
+                except Exception as e:
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+
+
+# Create Class for the Recommendation Service
+class RecommendationService:
+    def __init__(self, store:ArtifactStore=None, max_batch_size=256, max_wait_ms=2.0):
+        """
+        Loads the artifacts once and answers similar-movie queries for the HTTP handler.
+
+        Args:
+            store: ArtifactStore to serve (artifacts/store by default)
+            max_batch_size: maximum number of requests per kNN call
+            max_wait_ms: time spent filling a batch
+        """
+        self.artifacts = (ArtifactStore() if store is None else store).load(mmap_mode='r')
+        self.catalogue = ServingCatalogue(self.artifacts.movies)
+        self.models = {}
+        self.models_lock = threading.Lock()
+        self.build_locks = {}
+        self.personalized = None
+        self.personalized_lock = threading.Lock()
+        self.stats = LatencyStats()
+        self.batcher = MicroBatcher(self.get_model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        self.started = time.time()
+        # the default queries are ready before the first request
+        for metric, algorithm in SUPPORTED_METRICS.items():
+            self.get_model(metric, algorithm, DEFAULT_K + 1)
+
+    def _index(self, metric, algorithm, k):
+        """Neighbour table or saved ALS factors when they cover k, else an index of another k, else a new fit."""
+        if algorithm == 'als':
+            index = ALSModel.from_arrays(self.artifacts.arrays, self.artifacts.X)
+            if index is not None:
+                return index
+        elif algorithm != 'ann':
+            table = NeighbourTable.from_arrays(self.artifacts.arrays, metric)
+            if table is not None and table.n_neighbors >= k + 1:
+                return table
+        # indexes are shared between the k's of one (metric, algorithm)
+        with self.models_lock:
+            models = list(self.models.items())
+        for (m, a, _), model in models:
+            if (m, a) == (metric, algorithm) and not isinstance(model.index, NeighbourTable):
+                return model.index
+        return build_similarity_index(self.artifacts.X, metric=metric, algorithm=algorithm)
+
+    def get_model(self, metric, algorithm, k):
+        """ModelTraining per (metric, algorithm, k), served from the neighbour table (or saved ALS factors) when possible."""
+        model = self.models.get((metric, algorithm, k))
+        if model is not None:
+            return model
+        # one lock per (metric, algorithm): a fit only holds up the requests that need it
+        with self.models_lock:
+            build_lock = self.build_locks.setdefault((metric, algorithm), threading.Lock())
+        with build_lock:
+            if (metric, algorithm, k) not in self.models:
+                model = ModelTraining(
+                    movie_id=None,
+                    X=self.artifacts.X,
+                    movie_mapper=self.artifacts.movie_mapper,
+                    movie_inv_mapper=self.artifacts.movie_inv_mapper,
+                    k=k,
+                    metric=metric,
+                    algorithm=algorithm,
+                    index=self._index(metric, algorithm, k)
+                )
+                with self.models_lock:
+                    self.models[(metric, algorithm, k)] = model
+        return self.models[(metric, algorithm, k)]
+
+    def similar(self, movie_id, k=DEFAULT_K, metric='cosine', algorithm=None, timeout=30):
+        """Returns the k most similar movies of movie_id as a JSON-serialisable dict."""
+        if metric not in SERVED_ALGORITHMS:
+            raise ValueError(f'metric must be one of {sorted(SERVED_ALGORITHMS)}')
+        algorithm = algorithm or SUPPORTED_METRICS[metric]
+        if algorithm not in SERVED_ALGORITHMS[metric]:
+            raise ValueError(f'algorithm for metric {metric} must be one of {list(SERVED_ALGORITHMS[metric])}')
+        # ModelTraining drops the movie itself from its k neighbours, so ask for k+1;
+        # a missing index is fitted here, in the request thread, never in the batch dispatcher
+        self.get_model(metric, algorithm, k + 1)
+        neighbour_ids, distances = self.batcher.submit(movie_id, metric, algorithm, k + 1).result(timeout=timeout)
+        hydrated = self.catalogue.hydrate(neighbour_ids)
+        titles = dict(zip(hydrated['movieId'].tolist(), hydrated['title'].tolist()))
+        return {
+            'movieId': int(movie_id),
+            'metric': metric,
+            'algorithm': algorithm,
+            'k': k,
+            'neighbours': [{'movieId': int(n), 'title': titles.get(int(n)), 'distance': float(d)}
+                           for n, d in zip(neighbour_ids, distances)],
+        }
+
+    def get_personalized(self):
+        """PersonalizedRecommender over the served artifacts, fitted on first use."""
+        with self.personalized_lock:
+            if self.personalized is None:
+                self.personalized = PersonalizedRecommender(
+                    self.artifacts.X,
+                    self.artifacts.movie_mapper,
+                    self.artifacts.movie_inv_mapper,
+                    self.artifacts.user_mapper
+                ).fit()
+            return self.personalized
+
+    def recommend_for_user(self, user_id, n=12):
+        """Returns n unseen movies for a user of X as a JSON-serialisable dict."""
+        movie_ids, scores = self.get_personalized().recommend_for_user(user_id, n)
+        hydrated = self.catalogue.hydrate(movie_ids)
+        titles = dict(zip(hydrated['movieId'].tolist(), hydrated['title'].tolist()))
+        return {
+            'userId': int(user_id),
+            'n': n,
+            'recommendations': [{'movieId': int(m), 'title': titles.get(int(m)), 'score': float(score)}
+                                for m, score in zip(movie_ids, scores)],
+        }
+
+    def health(self):
+        return {'status': 'ok', 'version': self.artifacts.version, 'uptime_s': round(time.time() - self.started, 1)}
+
+    def metrics(self):
+        summary = self.stats.summary()
+        batches = self.batcher.batches
+        summary['batches'] = batches
+        summary['mean_batch_size'] = self.batcher.batched_requests / batches if batches else 0.0
+        return summary
+
+
+def make_handler(service:RecommendationService):
+    """Builds the request handler class bound to a service."""
+
+    class RecommendationHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, content):
+            body = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == '/health':
+                return self._send_json(200, service.health())
+            if url.path == '/metrics':
+                return self._send_json(200, service.metrics())
+            routes = {'/similar': self._similar, '/recommend': self._recommend}
+            if url.path not in routes:
+                return self._send_json(404, {'error': 'not found'})
+
+            start = time.perf_counter()
+            try:
+                status, content = routes[url.path](parse_qs(url.query))
+            except (KeyError, ValueError) as e:
+                status, content = 400, {'error': f'bad request: {e}'}
+            except Exception as e:
+                logging.error(f'Error in Recommendation Service: {e}')
+                status, content = 500, {'error': str(e)}
+            service.stats.record(time.perf_counter() - start, error=status >= 500)
+            self._send_json(status, content)
+
+        def _similar(self, params):
+            """Answers /similar?movieId=...&k=...&metric=... with the k most similar movies."""
+            movie_id = int(params['movieId'][0])
+            k = int(params.get('k', [str(DEFAULT_K)])[0])
+            metric = params.get('metric', ['cosine'])[0]
+            algorithm = params.get('algorithm', [None])[0]
+            if not 1 <= k <= MAX_K:
+                raise ValueError(f'k must be between 1 and {MAX_K}')
+            if metric not in SERVED_ALGORITHMS:
+                raise ValueError(f'metric must be one of {sorted(SERVED_ALGORITHMS)}')
+            if movie_id not in service.artifacts.movie_mapper:
+                return 404, {'error': f'unknown movieId {movie_id}'}
+            return 200, service.similar(movie_id, k=k, metric=metric, algorithm=algorithm)
+
+        def _recommend(self, params):
+            """Answers /recommend?userId=...&n=... with personalised recommendations."""
+            user_id = int(params['userId'][0])
+            n = int(params.get('n', [str(DEFAULT_K)])[0])
+            if not 1 <= n <= MAX_K:
+                raise ValueError(f'n must be between 1 and {MAX_K}')
+            if user_id not in service.artifacts.user_mapper:
+                return 404, {'error': f'unknown userId {user_id}'}
+            return 200, service.recommend_for_user(user_id, n=n)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    return RecommendationHandler
+
+
+def run_server(host='0.0.0.0', port=8000, store:ArtifactStore=None, max_batch_size=256, max_wait_ms=2.0):
+    """Loads the artifacts and serves /similar, /recommend, /health and /metrics until interrupted."""
+    service = RecommendationService(store, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    logging.info(f'Recommendation service listening on http://{host}:{port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
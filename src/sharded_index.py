@@ -0,0 +1,181 @@
+import logging
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.metrics import pairwise_distances
+from sklearn.preprocessing import normalize
+from src.cosine_engine import BYTES_PER_PAIR, top_k_smallest
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Default ceiling of the worker count: every worker costs a process start and a shard result to merge
+MAX_WORKERS = 8
+
+# Item matrix of the worker process, built over the shared buffers by _attach
+_WORKER = {}
+
+
+def resolve_workers(n_workers=None):
+    """Worker processes started for n_workers: all cores (at most MAX_WORKERS) for None or -1, never more than the cores."""
+    n_cores = os.cpu_count() or 1
+    if n_workers is None or n_workers < 0:
+        return min(n_cores, MAX_WORKERS)
+    return max(1, min(n_workers, n_cores))
+
+
+def _attach(buffers, shape, metric, memory_limit_mb):
+    """Worker initializer: maps the shared item-user CSR buffers without copying them."""
+    segments, arrays = [], {}
+    for name, (shm_name, dtype, size) in buffers.items():
+        segment = shared_memory.SharedMemory(name=shm_name)
+        segments.append(segment)
+        arrays[name] = np.ndarray(size, dtype=dtype, buffer=segment.buf)
+    _WORKER.update(segments=segments, metric=metric, memory_limit_mb=memory_limit_mb,
+                   item_matrix=csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False))
+
+
+def _shard_distances(queries, shard, metric):
+    """Dense (n_queries, shard size) distances of the query rows to the shard rows."""
+    if metric == 'cosine':
+        # rows are L2-normalised, so shard @ queries.T holds the cosine similarities; the shard stays a view
+        similarities = (shard @ queries.T).T.toarray()
+        # cosine distance as computed by sklearn, clipped against rounding errors
+        np.subtract(1.0, similarities, out=similarities)
+        np.clip(similarities, 0.0, 2.0, out=similarities)
+        return similarities
+    return pairwise_distances(queries, shard, metric=metric)
+
+
+def _query_shard(item_indices, start, stop, n_neighbors):
+    """Top-K of the query items among the items start..stop-1, with global item indices."""
+    item_matrix = _WORKER['item_matrix']
+    shard = item_matrix[start:stop]
+    n_neighbors = min(n_neighbors, stop - start)
+    block_size = max(1, int(_WORKER['memory_limit_mb'] * 1024**2 // ((stop - start) * BYTES_PER_PAIR)))
+    distances = np.empty((len(item_indices), n_neighbors), dtype=np.float64)
+    neighbours = np.empty((len(item_indices), n_neighbors), dtype=np.int64)
+    for block in range(0, len(item_indices), block_size):
+        rows = slice(block, block + block_size)
+        block_distances = _shard_distances(item_matrix[item_indices[rows]], shard, _WORKER['metric'])
+        distances[rows], neighbours[rows] = top_k_smallest(block_distances, n_neighbors)
+    return distances, neighbours + start
+
+
+def _release(executor, segments):
+    executor.shutdown(cancel_futures=True)
+    for segment in segments:
+        segment.close()
+        segment.unlink()
+
+
+# Create Class for the Sharded Similarity Index
+class ShardedSimilarityIndex:
+    def __init__(self, X, metric='cosine', algorithm='brute', n_workers=None, n_shards=None, memory_limit_mb=512):
+        """
+        Exact item kNN over the columns of X, computed by a pool of worker processes.
+
+        The item-user CSR buffers (the CSC layout of X) are copied once into shared
+        memory and every worker maps them without copying. A query is split over
+        the item range: each worker finds the top-K of its shard of items and the
+        shard results are merged, so even a single batch uses every core.
+
+        Args:
+            X: user-item utility matrix (users x items)
+            metric: distance metric ('cosine' or any sparse metric of sklearn's pairwise_distances)
+            algorithm: kept for the index contract, the search is always brute force
+            n_workers: number of worker processes (None or -1 uses all cores up to MAX_WORKERS, capped at the cores)
+            n_shards: number of item shards per query (n_workers by default)
+            memory_limit_mb: ceiling for the distances held by one worker at a time
+        """
+        self.X = X
+        self.metric = metric
+        self.algorithm = algorithm
+        self.n_workers = resolve_workers(n_workers)
+        self.n_shards = n_shards or self.n_workers
+        self.memory_limit_mb = memory_limit_mb
+        self.executor = None
+        self._finalizer = None
+
+    @property
+    def n_items(self):
+        return self.X.shape[1]
+
+    @property
+    def shards(self):
+        """(start, stop) item ranges of the shards."""
+        bounds = np.linspace(0, self.n_items, min(self.n_shards, self.n_items) + 1).astype(np.int64)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def fit(self):
+        """Places the item matrix in shared memory and starts the workers."""
+        try:
+            item_matrix = csr_matrix(self.X.T, dtype=np.float64)
+            if self.metric == 'cosine':
+                item_matrix = normalize(item_matrix, norm='l2', axis=1)
+
+            segments, buffers = [], {}
+            for name in ('data', 'indices', 'indptr'):
+                array = getattr(item_matrix, name)
+                segment = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+                segments.append(segment)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+                buffers[name] = (segment.name, array.dtype.str, array.size)
+            # the workers slice the queries out of the shared copy, this process keeps none
+            shape = item_matrix.shape
+            del item_matrix
+
+            self.executor = ProcessPoolExecutor(max_workers=self.n_workers, initializer=_attach,
+                                                initargs=(buffers, shape, self.metric, self.memory_limit_mb))
+            # shared memory outlives the process unless it is unlinked, so it is released with the index
+            self._finalizer = weakref.finalize(self, _release, self.executor, segments)
+            logging.info(f'Sharded Similarity Index Fitted: metric:{self.metric}, workers:{self.n_workers}, '
+                         f'shards:{len(self.shards)}')
+            return self
+        except Exception as e:
+            logging.error(f'Error in Fitting Sharded Similarity Index: {e}')
+            raise e
+
+    def kneighbors(self, item_indices, n_neighbors, return_distance=True):
+        """
+        Finds the nearest items for the given item indices.
+
+        Args:
+            item_indices: int or array of item (column) indices of X
+            n_neighbors: number of neighbours to return per item
+            return_distance: whether to return the distances as well
+
+        Returns:
+            distances (if return_distance) and neighbour item indices, both of shape (n_queries, n_neighbors)
+        """
+        if self.executor is None:
+            self.fit()
+        item_indices = np.atleast_1d(np.asarray(item_indices, dtype=np.int64))
+        n_neighbors = min(n_neighbors, self.n_items)
+        futures = [self.executor.submit(_query_shard, item_indices, start, stop, n_neighbors)
+                   for start, stop in self.shards]
+        results = [future.result() for future in futures]
+
+        # shards are in item order and sorted within, so a stable merge keeps ties ordered by item index
+        distances = np.concatenate([result[0] for result in results], axis=1)
+        neighbours = np.concatenate([result[1] for result in results], axis=1)
+        order = np.argsort(distances, axis=1, kind='stable')[:, :n_neighbors]
+        neighbours = np.take_along_axis(neighbours, order, axis=1)
+        if return_distance:
+            return np.take_along_axis(distances, order, axis=1), neighbours
+        return neighbours
+
+    def close(self):
+        """Stops the workers and frees the shared memory."""
+        if self._finalizer is not None:
+            self._finalizer()
+        self.executor = None
+
+    def __enter__(self):
+        return self if self.executor is not None else self.fit()
+
+    def __exit__(self, *exc_info):
+        self.close()
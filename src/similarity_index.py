@@ -0,0 +1,138 @@
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import NearestNeighbors
+from src.cosine_engine import CosineSimilarityEngine
+from src.ann_index import ANNIndex
+from src.als import ALSModel
+from src.sharded_index import ShardedSimilarityIndex, resolve_workers
+
+# Setup logging Configuration
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+# Fitted indexes shared by every caller, keyed by (id(X), metric, algorithm, n_workers). The registry keeps
+# every X alive (and the worker pools of sharded indexes), so only the most recently used ones are kept
+MAX_SHARED_INDEXES = 4
+_INDEX_REGISTRY = OrderedDict()
+_INDEX_REGISTRY_LOCK = threading.Lock()
+
+# Create Class for the Item-Item Similarity Index
+class ItemSimilarityIndex:
+    def __init__(self, X, metric='cosine', algorithm='brute', n_jobs=None):
+        """
+        Item-item kNN index over the columns of the user-item matrix.
+
+        The matrix is transposed and the NearestNeighbors model is fitted once,
+        then every query reuses them instead of refitting.
+
+        Args:
+            X: user-item utility matrix (users x items)
+            metric: distance metric for kNN calculations
+            algorithm: algorithm used by NearestNeighbors
+            n_jobs: number of parallel jobs used by kneighbors queries
+        """
+        self.X = X
+        self.metric = metric
+        self.algorithm = algorithm
+        self.n_jobs = n_jobs
+        self.item_matrix = None
+        self.model = None
+
+    @property
+    def n_items(self):
+        return self.X.shape[1]
+
+    def fit(self):
+        """Transposes X into an item-user CSR matrix and fits the kNN model on it."""
+        try:
+            self.item_matrix = csr_matrix(self.X.T)
+            self.model = NearestNeighbors(algorithm=self.algorithm, metric=self.metric, n_jobs=self.n_jobs)
+            self.model.fit(self.item_matrix)
+            logging.info(f'Item Similarity Index Fitted: metric:{self.metric}, algorithm:{self.algorithm}')
+            return self
+        except Exception as e:
+            logging.error(f'Error in Fitting Item Similarity Index: {e}')
+            raise e
+
+    def kneighbors(self, item_indices, n_neighbors, return_distance=True):
+        """
+        Finds the nearest items for the given item indices.
+
+        Args:
+            item_indices: int or array of item (column) indices of X
+            n_neighbors: number of neighbours to return per item
+            return_distance: whether to return the distances as well
+
+        Returns:
+            distances (if return_distance) and neighbour item indices, both of shape (n_queries, n_neighbors)
+        """
+        if self.model is None:
+            self.fit()
+        item_indices = np.atleast_1d(np.asarray(item_indices, dtype=np.int64))
+        n_neighbors = min(n_neighbors, self.n_items)
+        query = self.item_matrix[item_indices]
+        return self.model.kneighbors(query, n_neighbors=n_neighbors, return_distance=return_distance)
+
+
+def build_similarity_index(X, metric='cosine', algorithm='brute', n_jobs=None, memory_limit_mb=512, n_workers=None):
+    """
+    Builds and fits the item similarity index for (metric, algorithm).
+
+    The 'cosine'/'brute' path is served by the blocked CosineSimilarityEngine,
+    algorithm 'ann' by the approximate ANNIndex, algorithm 'als' by the item factors
+    of an ALSModel and every other combination by sklearn's NearestNeighbors.
+    With n_workers, the exact combinations are served by the ShardedSimilarityIndex
+    across worker processes instead, unless only one core is available: extra
+    processes on a single core only add their startup and the shared-memory copy.
+
+    Args:
+        X: user-item utility matrix
+        metric: distance metric for kNN calculations
+        algorithm: algorithm used for the kNN search
+        n_jobs: number of parallel jobs used by the cosine engine and NearestNeighbors queries
+        memory_limit_mb: memory ceiling of one block of the cosine engine
+        n_workers: worker processes of the sharded exact index (None or 1 keeps the single-process index,
+            -1 uses all cores up to MAX_WORKERS; counts above the number of cores are capped)
+
+    Returns:
+        fitted index exposing kneighbors(item_indices, n_neighbors, return_distance)
+    """
+    if algorithm == 'ann':
+        return ANNIndex(X, metric=metric).fit()
+    if algorithm == 'als':
+        return ALSModel(X).fit()
+    if n_workers is not None and resolve_workers(n_workers) > 1:
+        return ShardedSimilarityIndex(X, metric=metric, algorithm=algorithm, n_workers=n_workers,
+                                      memory_limit_mb=memory_limit_mb).fit()
+    if metric == 'cosine' and algorithm == 'brute':
+        return CosineSimilarityEngine(X, memory_limit_mb=memory_limit_mb, n_jobs=n_jobs).fit()
+    return ItemSimilarityIndex(X, metric=metric, algorithm=algorithm, n_jobs=n_jobs).fit()
+
+
+def get_similarity_index(X, metric='cosine', algorithm='brute', n_workers=None):
+    """
+    Returns the fitted index for (X, metric, algorithm), fitting it on first use.
+
+    At most MAX_SHARED_INDEXES indexes are kept; the least recently used ones are
+    dropped and closed (a sharded index stops its workers and frees its shared memory).
+    """
+    key = (id(X), metric, algorithm, n_workers)
+    with _INDEX_REGISTRY_LOCK:
+        index = _INDEX_REGISTRY.get(key)
+        if index is not None and index.X is X:
+            _INDEX_REGISTRY.move_to_end(key)
+            return index
+
+    index = build_similarity_index(X, metric=metric, algorithm=algorithm, n_workers=n_workers)
+    with _INDEX_REGISTRY_LOCK:
+        # an entry under the same key belongs to another X (or a concurrent build) and is replaced
+        evicted = [_INDEX_REGISTRY.pop(key)] if key in _INDEX_REGISTRY else []
+        _INDEX_REGISTRY[key] = index
+        while len(_INDEX_REGISTRY) > MAX_SHARED_INDEXES:
+            evicted.append(_INDEX_REGISTRY.popitem(last=False)[1])
+    for old_index in evicted:
+        if hasattr(old_index, 'close'):
+            old_index.close()
+    return index